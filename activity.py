@@ -0,0 +1,104 @@
+"""
+Per-user daily activity as a day bitmap, maintained at write time.
+
+rec["activity"] holds:
+
+    last    day number (date.toordinal) of the newest active day
+    bits    hex bitmap of active days; bit i = day `last - i`, so a multi-year history
+            is a few hundred characters
+    counts  answers per day for the newest COUNT_DAYS days (counts[i] = day `last - i`)
+    streak  consecutive active days ending at `last` (trailing ones of `bits`)
+    best    longest streak so far
+
+The journal updates it for every answer, so the Stats tab reads the streak and the
+heatmap from the user record alone.
+"""
+from datetime import date
+
+HEATMAP_WEEKS = 53
+COUNT_DAYS = HEATMAP_WEEKS * 7 + 6  # enough for the heatmap's partial first week
+
+
+def day_of(ts: float) -> int:
+    """Local calendar day of a timestamp as a day number."""
+    return date.fromtimestamp(ts).toordinal()
+
+
+def new_activity() -> dict:
+    return {"last": None, "bits": "0", "counts": [], "streak": 0, "best": 0}
+
+
+def _trailing_ones(bits: int) -> int:
+    return (bits ^ (bits + 1)).bit_length() - 1
+
+
+def _longest_run(bits: int) -> int:
+    n = 0
+    while bits:
+        bits &= bits << 1  # every pass shortens each run of ones by one
+        n += 1
+    return n
+
+
+def mark_day(rec: dict, day: int, answers: int = 1) -> None:
+    """Record `answers` answers on `day`; called for every answer."""
+    act = rec.get("activity")
+    if act is None:
+        act = rec["activity"] = new_activity()
+    last = act["last"]
+    bits = int(act["bits"], 16)
+    counts = act["counts"]
+    if last is None or day > last:
+        gap = day - last if last is not None else 0
+        bits = (bits << gap) | 1
+        counts[:0] = [0] * min(gap, COUNT_DAYS)
+        act["last"] = last = day
+        act["streak"] = _trailing_ones(bits)
+        act["best"] = max(act["best"], act["streak"])
+    else:
+        # a late event (e.g. a journal replayed after midnight) fills an older bit
+        bit = 1 << (last - day)
+        if not bits & bit:
+            bits |= bit
+            act["streak"] = _trailing_ones(bits)
+            act["best"] = max(act["best"], _longest_run(bits))
+    del counts[COUNT_DAYS:]
+    i = last - day
+    if i < COUNT_DAYS:
+        counts.extend([0] * (i + 1 - len(counts)))
+        counts[i] += answers
+    act["bits"] = format(bits, "x")
+
+
+# -------------------- READ --------------------
+def current_streak(act: dict | None, today: int) -> int:
+    """The streak is still alive if the last active day is today or yesterday."""
+    if not act or act["last"] is None or today - act["last"] > 1:
+        return 0
+    return act["streak"]
+
+
+def active_days(act: dict | None) -> int:
+    return bin(int(act["bits"], 16)).count("1") if act else 0
+
+
+def heatmap(act: dict | None, today: int, weeks: int = HEATMAP_WEEKS) -> list[list[int | None]]:
+    """
+    Answers per day as weeks x 7 (Monday first), oldest week first, ending with the week
+    of `today`. Days after today are None.
+    """
+    counts = act["counts"] if act else []
+    offset = today - act["last"] if act and act["last"] is not None else COUNT_DAYS
+    end = today + (6 - date.fromordinal(today).weekday())  # Sunday of this week
+    grid = []
+    for w in range(weeks):
+        week = []
+        for d in range(7):
+            day = end - (weeks - 1 - w) * 7 - 6 + d
+            if day > today:
+                week.append(None)
+                continue
+            i = today - day - offset
+            week.append(counts[i] if 0 <= i < len(counts) else 0)
+        grid.append(week)
+    return grid
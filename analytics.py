@@ -0,0 +1,128 @@
+"""
+Cohort aggregates, maintained at write time.
+
+When the journal folds a batch of answers into the store, the same transaction also
+updates one shared record (COHORT_ID). It holds attempts and misses per item and mode,
+answers per mode, the class accuracy and this week's top-K leaderboard. The
+instructor view reads that single record instead of scanning every user.
+"""
+import heapq
+from datetime import datetime, timezone
+from typing import Callable
+
+COHORT_ID = "__cohort__"  # reserved ids start with "__" (see storage.is_user_id)
+LEADERBOARD_SIZE = 10
+
+
+def week_id(ts: float) -> str:
+    """ISO week of a timestamp, e.g. "2026-W42" (sorts chronologically)."""
+    y, w, _ = datetime.fromtimestamp(ts, timezone.utc).isocalendar()
+    return f"{y}-W{w:02d}"
+
+
+def new_cohort() -> dict:
+    return {
+        "answers": 0,
+        "correct": 0,
+        "items": {},  # item -> mode -> [attempts, misses]
+        "modes": {},  # mode -> [attempts, misses]
+        "week": None,
+        "leaderboard": [],  # min-heap of [correct, answers, uid] for `week`, at most LEADERBOARD_SIZE
+    }
+
+
+def count_week(rec: dict, ts: float, ok: bool) -> None:
+    """Per-user answers of the current week (the leaderboard score); called for every answer."""
+    wk = week_id(ts)
+    week = rec.get("week")
+    if week is None or week["id"] < wk:
+        week = rec["week"] = {"id": wk, "answers": 0, "correct": 0}
+    elif week["id"] > wk:
+        return  # a late event from an earlier week
+    week["answers"] += 1
+    week["correct"] += int(ok)
+
+
+def _offer(cohort: dict, uid: str, week: dict) -> None:
+    if cohort["week"] != week["id"]:
+        if cohort["week"] is not None and week["id"] < cohort["week"]:
+            return
+        cohort["week"] = week["id"]
+        cohort["leaderboard"] = []
+    board = cohort["leaderboard"]
+    entry = [week["correct"], week["answers"], uid]
+    for i, e in enumerate(board):
+        if e[2] == uid:
+            # weekly scores only grow, so an entry never has to move out of the heap
+            board[i] = entry
+            heapq.heapify(board)
+            return
+    if len(board) < LEADERBOARD_SIZE:
+        heapq.heappush(board, entry)
+    elif entry > board[0]:
+        heapq.heapreplace(board, entry)
+
+
+def fold_cohort(cohort: dict, by_uid: dict[str, list[dict]], weeks: dict[str, dict]) -> None:
+    for events in by_uid.values():
+        for ev in events:
+            if ev["t"] != "review":
+                continue
+            qid = ev.get("qid")
+            mode = qid.rsplit(":", 1)[1] if qid else "?"
+            miss = 0 if ev["ok"] else 1
+            per_item = cohort["items"].setdefault(ev["item"], {}).setdefault(mode, [0, 0])
+            per_mode = cohort["modes"].setdefault(mode, [0, 0])
+            for counts in (per_item, per_mode):
+                counts[0] += 1
+                counts[1] += miss
+            cohort["answers"] += 1
+            cohort["correct"] += 1 - miss
+    for uid, week in weeks.items():
+        if week:
+            _offer(cohort, uid, week)
+
+
+def with_cohort(by_uid: dict[str, list[dict]], fns: dict[str, Callable[[dict], None]]) -> dict[str, Callable[[dict], None]]:
+    """
+    Journal fold hook: the per-user updates plus the cohort update, applied in one batch.
+    The cohort update runs last and reads each user's weekly score after their fold.
+    """
+    weeks: dict[str, dict] = {}
+
+    def track(uid: str, fn: Callable[[dict], None]) -> Callable[[dict], None]:
+        def run(rec: dict) -> None:
+            fn(rec)
+            weeks[uid] = rec.get("week")
+        return run
+
+    out = {uid: track(uid, fn) for uid, fn in fns.items()}
+    out[COHORT_ID] = lambda rec: fold_cohort(_init(rec), by_uid, weeks)
+    return out
+
+
+def _init(rec: dict) -> dict:
+    if "items" not in rec:  # the store creates a blank user record the first time
+        rec.clear()
+        rec.update(new_cohort())
+    return rec
+
+
+# -------------------- READ --------------------
+def hardest(cohort: dict, prefix: str = "", min_attempts: int = 5, k: int = 10) -> list[dict]:
+    """(item, mode) pairs with the highest miss rate; bounded by catalog size, not cohort size."""
+    rows = [
+        {"item": item, "mode": mode, "attempts": a, "misses": m, "miss_rate": m / a}
+        for item, modes in cohort.get("items", {}).items() if item.startswith(prefix)
+        for mode, (a, m) in modes.items() if a >= min_attempts
+    ]
+    return heapq.nlargest(k, rows, key=lambda r: (r["miss_rate"], r["attempts"]))
+
+
+def mode_accuracy(cohort: dict) -> dict[str, float]:
+    return {mode: 1 - m / a for mode, (a, m) in cohort.get("modes", {}).items() if a}
+
+
+def leaderboard(cohort: dict) -> list[dict]:
+    return [{"uid": uid, "correct": c, "answers": a}
+            for c, a, uid in sorted(cohort.get("leaderboard", []), reverse=True)]
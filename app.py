@@ -1,142 +1,46 @@
+import time
+
+_run_started = time.perf_counter()
+
+import copy
+import io
 import json
 import random
-import time
 from datetime import date
-from dataclasses import dataclass
-from pathlib import Path
+from functools import partial
+from typing import Callable
 
 import streamlit as st
 
+from activity import active_days, current_streak, heatmap
+from analytics import COHORT_ID, hardest, leaderboard, mode_accuracy
+from bulk import export_lines, import_lines, prepare_record, validate_record
+from calibrate import CALIBRATION_ID, calibrate, estimate_ability
+from config import (ADMIN_PASSWORD, BASE_URL, DESKTOP_IMAGE_WIDTH, MOBILE_CSS, MOBILE_IMAGE_WIDTH,
+                    WRONGS_KEEP)
+from deck import BONE_MODES, CN_STYLES, Question, generate_deck, item_id
+from metrics import METRICS, observe, timed
+from prefetch import Prefetcher
+from questions import (check_bone_answer, check_cn_answer, item_keywords, miss_weights,
+                       question_id, question_item, render_question)
+from review import ReviewIndex, signature as review_signature
+from services import (get_assets, get_catalog, get_journal, get_matcher, get_metrics_exporter, get_prefetch_pool,
+                      get_run_times, get_store, get_writer)
+from storage import is_user_id
+from writer import UnitOfWork
+
+# Process-wide setup (packs, storage, journal, images) lives in services.py and is built
+# once per process; everything below runs per rerun and should stay session work only.
+
 # -------------------- CONFIG --------------------
 st.set_page_config(page_title="Skull Trainer", page_icon="🧠", layout="centered")
-
-DATA_DIR = Path("data")
-DATA_DIR.mkdir(exist_ok=True)
-USERS_DB = DATA_DIR / "users.json"  # user-specific storage
-
-ASSETS_DIR = Path("assets/bones")
-
-MOBILE_CSS = """
-<style>
-/* Streamlit theme variables:
-   --background-color, --secondary-background-color, --text-color, --primary-color */
-
-:root{
-  --card-radius: 16px;
-}
-
-/* Genel container: tema neyse ona uy */
-.block-container{
-  padding-top: 1.2rem;
-  padding-bottom: 3rem;
-  max-width: 900px;
-}
-
-/* Kart hissi (her iki temada da güzel) */
-[data-testid="stVerticalBlockBorderWrapper"]{
-  border-radius: var(--card-radius) !important;
-}
-
-/* Butonlar: primary rengi kullanır, her temada uyumlu */
-.stButton button{
-  border-radius: 16px !important;
-  padding: 0.75rem 1.1rem !important;
-  font-weight: 700 !important;
-  border: 1px solid rgba(127,127,127,0.25) !important;
-}
-
-/* Input'lar */
-div[data-baseweb="input"] input{
-  border-radius: 14px !important;
-}
-
-/* Tabs */
-.stTabs [data-baseweb="tab"]{
-  font-size: 1.05rem;
-  font-weight: 700;
-}
-
-/* --- LIGHT THEME OVERRIDES --- */
-@media (prefers-color-scheme: light){
-  .block-container{
-    background: linear-gradient(180deg, rgba(245,250,255,1) 0%, rgba(238,244,255,1) 100%);
-  }
-  h1{ color: #1f2fbf; font-weight: 800; }
-  .stButton button{
-    background: linear-gradient(135deg, #4f6cff, #6ea8ff) !important;
-    color: white !important;
-    box-shadow: 0 6px 14px rgba(79,108,255,0.35);
-  }
-  div[data-baseweb="input"] input{
-    border: 2px solid rgba(79,108,255,0.28) !important;
-  }
-}
-
-/* --- DARK THEME OVERRIDES --- */
-@media (prefers-color-scheme: dark){
-  .block-container{
-    background: radial-gradient(1200px 600px at 20% 0%, rgba(90,110,255,0.18), transparent 50%),
-                radial-gradient(900px 500px at 90% 20%, rgba(60,200,255,0.12), transparent 50%);
-  }
-  h1{ color: #dbe6ff; font-weight: 800; }
-  .stButton button{
-    background: linear-gradient(135deg, #3f5bff, #2bd6ff) !important;
-    color: #071018 !important;
-    box-shadow: 0 8px 18px rgba(0,0,0,0.35);
-    border: none !important;
-  }
-  div[data-baseweb="input"] input{
-    border: 2px solid rgba(43,214,255,0.22) !important;
-  }
-}
-</style>
-"""
-
-
 st.markdown(MOBILE_CSS, unsafe_allow_html=True)
 
-# -------------------- DATA --------------------
-BONES = [
-    {"name": "Frontal",   "latin": "Os frontale",   "category": "neurocranium",
-     "landmarks": ["Supraorbital foramen", "Glabella", "Frontal sinus"]},
-    {"name": "Parietal",  "latin": "Os parietale",  "category": "neurocranium",
-     "landmarks": ["Parietal foramen", "Superior temporal line"]},
-    {"name": "Temporal",  "latin": "Os temporale",  "category": "neurocranium",
-     "landmarks": ["Mastoid process", "Styloid process", "External acoustic meatus", "Carotid canal"]},
-    {"name": "Occipital", "latin": "Os occipitale", "category": "neurocranium",
-     "landmarks": ["Foramen magnum", "Occipital condyles", "External occipital protuberance", "Hypoglossal canal"]},
-    {"name": "Sphenoid",  "latin": "Os sphenoidale","category": "neurocranium",
-     "landmarks": ["Sella turcica", "Optic canal", "Superior orbital fissure", "Foramen rotundum", "Foramen ovale", "Foramen spinosum"]},
-    {"name": "Ethmoid",   "latin": "Os ethmoidale", "category": "neurocranium",
-     "landmarks": ["Cribriform plate", "Crista galli"]},
-    {"name": "Maxilla",   "latin": "Maxilla",       "category": "viscerocranium",
-     "landmarks": ["Infraorbital foramen", "Maxillary sinus", "Alveolar process"]},
-    {"name": "Mandible",  "latin": "Mandibula",     "category": "viscerocranium",
-     "landmarks": ["Mental foramen", "Mandibular foramen", "Condylar process"]},
-    {"name": "Zygomatic", "latin": "Os zygomaticum","category": "viscerocranium",
-     "landmarks": ["Zygomatic arch", "Zygomaticofacial foramen"]},
-    {"name": "Nasal",     "latin": "Os nasale",     "category": "viscerocranium",
-     "landmarks": ["Nasion"]},
-]
-
-# Cranial nerves & foramina (Kurul modu)
-CN_FORAMINA = [
-    {"cn": "CN I",  "name": "Olfactory",      "foramen": "Cribriform plate"},
-    {"cn": "CN II", "name": "Optic",          "foramen": "Optic canal"},
-    {"cn": "CN III","name": "Oculomotor",     "foramen": "Superior orbital fissure"},
-    {"cn": "CN IV", "name": "Trochlear",      "foramen": "Superior orbital fissure"},
-    {"cn": "CN V1", "name": "Ophthalmic",     "foramen": "Superior orbital fissure"},
-    {"cn": "CN V2", "name": "Maxillary",      "foramen": "Foramen rotundum"},
-    {"cn": "CN V3", "name": "Mandibular",     "foramen": "Foramen ovale"},
-    {"cn": "CN VI", "name": "Abducens",       "foramen": "Superior orbital fissure"},
-    {"cn": "CN VII","name": "Facial",         "foramen": "Internal acoustic meatus"},
-    {"cn": "CN VIII","name":"Vestibulocochlear","foramen":"Internal acoustic meatus"},
-    {"cn": "CN IX", "name": "Glossopharyngeal","foramen": "Jugular foramen"},
-    {"cn": "CN X",  "name": "Vagus",          "foramen": "Jugular foramen"},
-    {"cn": "CN XI", "name": "Accessory",      "foramen": "Jugular foramen"},
-    {"cn": "CN XII","name": "Hypoglossal",    "foramen": "Hypoglossal canal"},
-    {"cn": "CN VII (exit)", "name":"Facial (exit)", "foramen":"Stylomastoid foramen"},
-]
+CATALOG = get_catalog()
+BONES = CATALOG.bones
+CN_FORAMINA = CATALOG.cn_foramina
+ASSETS = get_assets()  # image variants are built on the process's first run, not on a quiz start
+REVIEW_TABS = {"quiz": "Skull Quiz", "exam": "Exam", "cn": "CN Foraminal"}  # yanlışın geldiği sekme
 
 # -------------------- USER ID (per-user, not mixed) --------------------
 def short_id(n=8):
@@ -144,68 +48,71 @@ def short_id(n=8):
     return "".join(random.choice(alphabet) for _ in range(n))
 
 def get_user_id():
-    # Streamlit query params: user-specific id in URL (?u=xxxx)
+    # Streamlit query params: user-specific id in URL (?u=xxxx), resolved once per session
+    if "uid" in st.session_state:
+        return st.session_state.uid
     qp = st.query_params
-    if "u" in qp and str(qp["u"]).strip():
-        return str(qp["u"]).strip()
-    uid = short_id()
-    st.query_params["u"] = uid
+    if "u" in qp and str(qp["u"]).strip() and is_user_id(str(qp["u"]).strip()):
+        uid = str(qp["u"]).strip()
+    else:
+        uid = short_id()
+        st.query_params["u"] = uid
+    st.session_state.uid = uid
     return uid
 
 USER_ID = get_user_id()
 
 # -------------------- STORAGE --------------------
-def _load_users_db() -> dict:
-    if not USERS_DB.exists():
-        return {}
-    try:
-        return json.loads(USERS_DB.read_text(encoding="utf-8"))
-    except Exception:
-        return {}
-
-def _save_users_db(db: dict) -> None:
-    USERS_DB.write_text(json.dumps(db, ensure_ascii=False, indent=2), encoding="utf-8")
+STORE = get_store()
+STORE.sync()  # drop records other processes changed; the only storage check this rerun
+JOURNAL = get_journal()
+WRITER = get_writer()
+get_metrics_exporter()
 
 def get_user_record(uid: str) -> dict:
-    db = _load_users_db()
-    if uid not in db:
-        db[uid] = {
-            "stats": {"correct": 0, "total": 0},
-            "wrongs": [],  # list of {q,user,correct,ts}
-        }
-        _save_users_db(db)
-    return db[uid]
-
-def update_user_record(uid: str, record: dict) -> None:
-    db = _load_users_db()
-    db[uid] = record
-    _save_users_db(db)
-
-def add_stats(uid: str, correct_delta: int, total_delta: int) -> None:
-    rec = get_user_record(uid)
-    rec["stats"]["correct"] += int(correct_delta)
-    rec["stats"]["total"] += int(total_delta)
-    update_user_record(uid, rec)
+    return JOURNAL.view(uid)
+
+def update_user_record(uid: str, fn: Callable[[dict], None]) -> dict:
+    # önce bu sürecin bekleyen cevapları yazılır (sıra korunur), sonra sürüm kontrollü yazma:
+    # araya başka bir oturum/replika girdiyse fn yeni sürüm üzerinde tekrar çalışır
+    JOURNAL.compact()
+    return STORE.update_optimistic(uid, fn)
+
+def record_event(uid: str, ev: dict, uow: UnitOfWork | None = None) -> None:
+    # quiz sırasında olaylar tur (unit of work) bitene kadar session'da bekler
+    if uow is not None:
+        uow.add(ev)
+    else:
+        JOURNAL.append(uid, ev)
 
-def log_wrong(uid: str, q: str, user: str, correct: str) -> None:
-    rec = get_user_record(uid)
-    rec["wrongs"].append({"q": q, "user": user, "correct": correct, "ts": int(time.time())})
-    update_user_record(uid, rec)
+def add_stats(uid: str, correct_delta: int, total_delta: int, uow: UnitOfWork | None = None) -> None:
+    record_event(uid, {"t": "stats", "correct": int(correct_delta), "total": int(total_delta)}, uow)
+
+def log_wrong(uid: str, q: str, user: str, correct: str, qid: str | None = None, uow: UnitOfWork | None = None,
+              tab: str | None = None) -> None:
+    record_event(uid, {"t": "wrong", "q": q, "user": user, "correct": correct, "ts": int(time.time()), "qid": qid,
+                       "tab": tab}, uow)
 
 def get_wrongs(uid: str):
     return get_user_record(uid)["wrongs"]
 
+def get_review_index(uid: str) -> ReviewIndex:
+    # indeks yanlış listesi değişene kadar session'da tekrar kullanılır
+    wrongs = get_wrongs(uid)
+    sig = (uid, review_signature(wrongs))
+    cached = st.session_state.get("review_index")
+    if cached is None or cached[0] != sig:
+        cached = st.session_state.review_index = (sig, ReviewIndex(wrongs, partial(item_keywords, CATALOG)))
+    return cached[1]
+
 def clear_wrongs(uid: str):
-    rec = get_user_record(uid)
-    rec["wrongs"] = []
-    update_user_record(uid, rec)
+    JOURNAL.append(uid, {"t": "clear_wrongs"})
 
 def reset_stats(uid: str):
-    rec = get_user_record(uid)
-    rec["stats"] = {"correct": 0, "total": 0}
-    update_user_record(uid, rec)
+    JOURNAL.append(uid, {"t": "reset_stats"})
 
 def export_progress(uid: str) -> str:
+    # download_button calls this only when the user clicks (see SIDEBAR)
     rec = get_user_record(uid)
     payload = {"uid": uid, "exported_at": int(time.time()), "data": rec}
     return json.dumps(payload, ensure_ascii=False, indent=2)
@@ -214,90 +121,87 @@ def import_progress(uid: str, json_text: str) -> tuple[bool, str]:
     try:
         payload = json.loads(json_text)
         data = payload.get("data")
-        if not isinstance(data, dict):
-            return False, "JSON formatı tanınmadı. (data yok)"
-        if "stats" not in data or "wrongs" not in data:
-            return False, "JSON formatı tanınmadı. (stats/wrongs eksik)"
-        if not isinstance(data["stats"], dict) or not isinstance(data["wrongs"], list):
-            return False, "JSON formatı bozuk."
-        update_user_record(uid, data)
+        err = validate_record(data)
+        if err:
+            return False, err
+        prepare_record(CATALOG, data, WRONGS_KEEP)
+
+        def replace(rec: dict) -> None:
+            rec.clear()
+            rec.update(copy.deepcopy(data))
+        update_user_record(uid, replace)
         return True, "Import tamam ✅"
     except json.JSONDecodeError:
         return False, "JSON okunamadı. (format hatalı)"
     except Exception:
         return False, "Import sırasında beklenmeyen hata oldu."
 
-
 # -------------------- HELPERS --------------------
-def bone_image_path(bone_name: str):
-    p_png = ASSETS_DIR / f"{bone_name.lower()}.png"
-    p_jpg = ASSETS_DIR / f"{bone_name.lower()}.jpg"
-    if p_png.exists():
-        return p_png
-    if p_jpg.exists():
-        return p_jpg
-    return None
-
-def wrong_weights(pool_names: list[str]) -> dict:
+def image_width() -> int:
+    ua = st.context.headers.get("User-Agent", "")
+    return MOBILE_IMAGE_WIDTH if "Mobi" in ua else DESKTOP_IMAGE_WIDTH
+
+def question_loader(images: bool) -> Callable[[Question], tuple[str, str, bytes | None]]:
+    # Prefetcher thread'lerinde çalışır: st.* yok, cihaz genişliği burada bağlanır
+    width = image_width() if images else None
+
+    def load(q: Question) -> tuple[str, str, bytes | None]:
+        text, ans = render_question(CATALOG, q)
+        img = ASSETS.image_bytes(CATALOG.bones[q.idx]["name"], width) if images and q.kind == "bone" else None
+        return text, ans, img
+    return load
+
+def wrong_weights(items: list[str], modes: tuple[str, ...]) -> dict:
+    return miss_weights(get_user_record(USER_ID).get("misses", {}), items, modes)
+
+# -------------------- DECKS --------------------
+# The whole deck is generated at start from a seed (deck.py); a rerun only renders deck[i].
+def new_deck(kind: str, pool: list[int], total: int, seed: int | None = None, personal: bool = True,
+             adaptive: bool | None = None, images: bool = False) -> dict:
     """
-    Wrong listesindeki kemik adı soru içinde geçiyorsa o kemiğin ağırlığını artır.
+    personal=True: sıra kullanıcının SRS kuyruğundan (hiç görülmemiş ve eski yanlışı çok olan önce).
+    personal=False: sadece seed'e bağlı, aynı kod herkese aynı desteyi verir.
+    adaptive (varsayılan: personal): kalibrasyon varsa sorular öğrencinin seviyesine yakın seçilir.
+    Sıradaki sorular (images=True ise görselleriyle) arka planda hazırlanır (prefetch.py).
     """
-    weights = {name: 1 for name in pool_names}
-    for item in get_wrongs(USER_ID):
-        q = item["q"].lower()
-        for name in pool_names:
-            if name.lower() in q:
-                weights[name] += 3
-    return weights
-
-def pick_weighted(pool: list[dict]) -> dict:
-    names = [b["name"] for b in pool]
-    wmap = wrong_weights(names)
-    weights = [wmap[b["name"]] for b in pool]
-    return random.choices(pool, weights=weights, k=1)[0]
-
-def make_bone_question(bone: dict):
-    mode = random.choice(["latin", "category", "landmark"])
-    if mode == "latin":
-        return f"**{bone['name']}** kemiğinin Latin adı nedir?", bone["latin"], mode
-    if mode == "category":
-        return f"**{bone['name']}** hangi kategori? (neurocranium / viscerocranium)", bone["category"], mode
-    example = random.choice(bone["landmarks"]) if bone["landmarks"] else ""
-    return f"**{bone['name']}** ile ilişkili landmark yaz (örn: {example})", " / ".join(bone["landmarks"]), mode
-
-def check_bone_answer(mode: str, bone: dict, user: str, correct: str) -> bool:
-    u = user.strip().lower()
-    if not u:
-        return False
-    if mode == "landmark":
-        return u in {x.lower() for x in bone["landmarks"]}
-    return u == correct.lower()
-
-def make_cn_question():
-    item = random.choice(CN_FORAMINA)
-    style = random.choice(["cn_to_foramen", "foramen_to_cn"])
-    if style == "cn_to_foramen":
-        q = f"**{item['cn']} ({item['name']})** hangi yapıdan geçer?"
-        a = item["foramen"]
-        return q, a, style
-    else:
-        q = f"**{item['foramen']}** içinden geçen sinir hangisi?"
-        a = f"{item['cn']} ({item['name']})"
-        return q, a, style
-
-def check_cn_answer(style: str, user: str, correct: str) -> bool:
-    u = user.strip().lower()
-    if not u:
-        return False
-    # foramen->cn sorusunda kullanıcı "CN X" yazsa da kabul edelim
-    if style == "foramen_to_cn":
-        return u in correct.lower() or u.replace(" ", "") in correct.lower().replace(" ", "")
-    return u == correct.lower()
+    seed = random.randrange(1_000_000) if seed is None else seed
+    adaptive = personal if adaptive is None else adaptive
+    states = weights = difficulty = None
+    ability = 0.0
+    if personal or adaptive:
+        rec = get_user_record(USER_ID)
+    if personal:
+        items = [item_id(CATALOG, kind, i) for i in pool]
+        srs = rec.get("srs", {})
+        states = {item: srs[item] for item in items if item in srs}
+        weights = wrong_weights(items, BONE_MODES if kind == "bone" else CN_STYLES)
+    if adaptive:
+        difficulty = (STORE.get(CALIBRATION_ID) or {}).get("difficulty")
+        if difficulty:
+            ability = estimate_ability(rec.get("attempts", {}), difficulty)
+    deck = generate_deck(CATALOG, kind, pool, total, seed, states, weights, difficulty, ability)
+    # kişisel ya da kalibrasyona göre seçilen deste aynı kodla tekrar üretilemez
+    replayable = not personal and not difficulty
+    return {"running": True, "seed": seed, "replayable": replayable, "deck": deck, "i": 0, "total": total,
+            "correct": 0, "uow": WRITER.open(USER_ID),
+            "prefetch": Prefetcher(get_prefetch_pool(), deck, question_loader(images))}
+
+def end_round(sess: dict) -> None:
+    """Turu tek seferde kaydet (bitti, durduruldu ya da yenisi başladı)."""
+    if sess.get("uow") is not None:
+        sess["uow"].commit()
+    if sess.get("prefetch") is not None:
+        sess["prefetch"].close()
+
+def answer_review(q: Question, ok: bool, uow: UnitOfWork | None = None) -> None:
+    # qid: sınıf analitiği item + mod bazında sayar (analytics.py)
+    record_event(USER_ID, {"t": "review", "item": question_item(CATALOG, q), "qid": question_id(CATALOG, q),
+                           "ok": ok, "ts": int(time.time())}, uow)
 
 # -------------------- SIDEBAR --------------------
+_sidebar_started = time.perf_counter()
 st.sidebar.title("⚙️ Controls")
-base_url = "https://skull-trainer-nehir.streamlit.app"
-personal_link = f"{base_url}?u={USER_ID}"
+personal_link = f"{BASE_URL}?u={USER_ID}"
 st.sidebar.code(personal_link)
 
 st.sidebar.write("**Kullanıcı kodun:**")
@@ -305,10 +209,9 @@ st.sidebar.code(USER_ID)
 
 st.sidebar.divider()
 st.sidebar.write("**Export / Import**")
-export_text = export_progress(USER_ID)
 st.sidebar.download_button(
     "⬇️ Progress indir (JSON)",
-    data=export_text,
+    data=partial(export_progress, USER_ID),
     file_name="skull_trainer_progress.json",
     mime="application/json",
     use_container_width=True,
@@ -326,79 +229,188 @@ if st.sidebar.button("Import et", use_container_width=True):
         else:
             st.sidebar.error(msg)
 
+is_admin = show_metrics = False
+if ADMIN_PASSWORD:
+    with st.sidebar.expander("👩‍🏫 Eğitmen: toplu export / import"):
+        is_admin = st.text_input("Eğitmen şifresi", type="password") == ADMIN_PASSWORD
+        if is_admin:
+            show_metrics = st.toggle("📈 Operatör metrikleri")
+            # büyük sınıflar için CLI da var: python bulk.py export / import
+            def export_cohort() -> str:
+                # download_button needs the whole file in memory: fine for a class, for large
+                # cohorts use the streaming CLI (python bulk.py export > cohort.ndjson)
+                JOURNAL.compact()
+                return "".join(export_lines(STORE))
+
+            st.caption("Sidebar export'u tek sınıf içindir; büyük kohortlar için: `python bulk.py export > cohort.ndjson`")
+            st.download_button(
+                "⬇️ Tüm kullanıcılar (NDJSON)",
+                data=export_cohort,
+                file_name="skull_trainer_cohort.ndjson",
+                mime="application/x-ndjson",
+                use_container_width=True,
+            )
+            up = st.file_uploader("⬆️ NDJSON yükle", type=["ndjson", "jsonl"])
+            if up is not None and st.button("Toplu import et", use_container_width=True):
+                imported, skipped, errors = import_lines(io.TextIOWrapper(up, encoding="utf-8"), STORE, prepare=partial(prepare_record, CATALOG, keep=WRONGS_KEEP))
+                st.success(f"{imported} kullanıcı import edildi.")
+                if skipped:
+                    st.warning(f"{skipped} satır atlandı: " + "; ".join(f"satır {no}: {err}" for no, err in errors[:5]))
+observe("skull_section_seconds", time.perf_counter() - _sidebar_started, section="sidebar")
+
+# -------------------- METRICS (eğitmen) --------------------
+def _label_text(labels: dict) -> str:
+    return ", ".join(f"{k}={v}" for k, v in labels.items())
+
+def metrics_page() -> None:
+    st.title("📈 Operatör metrikleri")
+    st.caption("Bu sürecin (process) sayıları; her replika kendi metriklerini tutar.")
+    rt = get_run_times().summary()
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Açılış (cold start)", f"{rt['cold_ms']} ms")
+    c2.metric("Rerun p50", f"{rt['warm_p50_ms']} ms")
+    c3.metric("Rerun p95", f"{rt['warm_p95_ms']} ms")
+
+    hists, counters = METRICS.snapshot()
+    st.subheader("Süreler")
+    st.dataframe([{**h, "labels": _label_text(h["labels"])} for h in hists], use_container_width=True)
+    st.subheader("Sayaçlar")
+    st.dataframe([{**c, "labels": _label_text(c["labels"])} for c in counters], use_container_width=True)
+    st.subheader("Kullanıcı kaydı önbelleği")
+    st.json(STORE.stats())
+    st.download_button("⬇️ Prometheus metrikleri (text)", data=METRICS.prometheus,
+                       file_name="skull_trainer.prom", mime="text/plain")
+
+if is_admin and show_metrics:
+    metrics_page()
+    st.stop()
+
 # -------------------- UI --------------------
 st.title("🧠 Skull Trainer Web App")
 
-tabs = st.tabs(["Skull Quiz", "Exam", "CN Foraminal", "Review", "Stats"])
+tabs = st.tabs(["Skull Quiz", "Exam", "CN Foraminal", "Review", "Stats", *(["Sınıf"] if is_admin else [])])
+
+# Soru panelleri ve exam sayacı fragment: bir cevap/tık sadece kendi panelini yeniden çalıştırır,
+# sidebar, Review ve Stats tekrar kurulmaz.
 
 # ---------- SKULL QUIZ ----------
-with tabs[0]:
+@st.fragment
+@timed("skull_section_seconds", section="skull_panel")
+def skull_panel(show_img: bool):
+    s = st.session_state.skull
+    if not s.get("running"):
+        return
+    if s["i"] >= s["total"]:
+        s["running"] = False
+        add_stats(USER_ID, s["correct"], s["total"], s["uow"])
+        end_round(s)
+        st.balloons()
+        st.success(f"🏁 Bitti! Skor: {s['correct']}/{s['total']}")
+        return
+
+    cur = s["deck"][s["i"]]
+    bone = CATALOG.bones[cur.idx]
+    q, ans, img = s["prefetch"].get(s["i"])
+    st.progress((s["i"] + 1) / s["total"])
+    st.caption(f"✨ XP: {s['correct']*10}  |  🎯 Accuracy: {(s['correct']/max(1,s['i']))*100:.0f}%")
+    st.info(q)
+
+    if show_img:
+        if img:
+            st.image(img, use_container_width=True)
+        else:
+            st.caption("🖼️ Görsel yok. (assets/bones içine eklersen otomatik çıkar.)")
+
+    user = st.text_input("Cevabın", key=f"sk_ans_{s['i']}")
+    colA, colB = st.columns(2)
+    with colA:
+        if st.button("✅ Cevapla", use_container_width=True):
+            ok = check_bone_answer(get_matcher(), cur.mode, bone, user)
+            if ok:
+                s["correct"] += 1
+                st.success("Doğru ✅")
+                st.toast("🔥 Nice! +10 XP", icon="🧠")
+            else:
+                st.toast("😈 Almost. Review’e düştü.", icon="📌")
+                log_wrong(USER_ID, q, user, ans, question_id(CATALOG, cur), s["uow"], tab="quiz")
+            answer_review(cur, ok, s["uow"])
+            s["i"] += 1
+    with colB:
+        if st.button("⏭️ Pas", use_container_width=True):
+            s["i"] += 1
+
+with tabs[0], timed("skull_section_seconds", section="skull_tab"):
     st.subheader("Skull Quiz (Öğrenen Mod)")
     c1, c2 = st.columns(2)
     with c1:
         n_q = st.number_input("Soru sayısı", 1, 50, 10)
     with c2:
-        focus = st.selectbox("Kategori", ["hepsi", "neurocranium", "viscerocranium"])
+        focus = st.selectbox("Kategori", ["hepsi", *CATALOG.categories])
     show_img = st.toggle("Görsel göster (assets varsa)", value=True)
 
     if "skull" not in st.session_state:
         st.session_state.skull = {"running": False}
 
     def start_skull():
-        pool = BONES[:]
-        if focus != "hepsi":
-            pool = [b for b in pool if b["category"] == focus]
-        st.session_state.skull = {"running": True, "pool": pool, "i": 0, "total": int(n_q), "correct": 0, "cur": None}
+        end_round(st.session_state.skull)
+        pool = BONES if focus == "hepsi" else CATALOG.bones_by_category.get(focus, [])
+        st.session_state.skull = new_deck("bone", [CATALOG.bone_index[b["name"]] for b in pool or BONES], int(n_q), images=True)
 
     st.button("🚀 Yeni Quiz Başlat", on_click=start_skull, use_container_width=True)
+    skull_panel(show_img)
 
-    s = st.session_state.skull
-    if s.get("running"):
-        if s["i"] >= s["total"]:
-            s["running"] = False
-            add_stats(USER_ID, s["correct"], s["total"])
-            st.balloons()
-            st.success(f"🏁 Bitti! Skor: {s['correct']}/{s['total']}")
+# ---------- EXAM ----------
+def exam_time_left(e: dict) -> int:
+    return max(0, e["limit"] - int(time.time() - e["start"]))
+
+@st.fragment(run_every=1)
+@timed("skull_section_seconds", section="exam_timer")
+def exam_timer():
+    # her saniye sadece bu blok yeniden çizilir
+    e = st.session_state.exam
+    if not e.get("running"):
+        st.rerun()  # sınav panelden bitti: tam çalıştırma sayacı artık kaydetmez
+    left = exam_time_left(e)
+    st.write(f"⏳ Kalan süre: **{left//60:02d}:{left%60:02d}**")
+    if e.get("replayable"):
+        st.caption(f"🎲 Deste kodu: {e['seed']}")
+    else:
+        st.caption("🎯 Sorular seviyene göre seçildi (kodla tekrarlanamaz)")
+    st.progress(1 - (left / e["limit"]) if e["limit"] else 0)
+    if left == 0:
+        st.rerun()  # süre bitti: exam_panel sınavı kapatsın
+
+@st.fragment
+@timed("skull_section_seconds", section="exam_panel")
+def exam_panel():
+    e = st.session_state.exam
+    if not e.get("running"):
+        return
+    if exam_time_left(e) == 0 or e["i"] >= e["total"]:
+        e["running"] = False
+        add_stats(USER_ID, e["correct"], e["total"], e["uow"])
+        end_round(e)
+        st.error(f"🏁 Exam bitti! Skor: {e['correct']}/{e['total']}")
+        return
+
+    cur = e["deck"][e["i"]]
+    bone = CATALOG.bones[cur.idx]
+    q, ans, _ = e["prefetch"].get(e["i"])
+    st.write(f"**Soru {e['i']+1}/{e['total']}**")
+    st.info(q)
+    user = st.text_input("Cevabın", key=f"ex_ans_{e['i']}")
+    if st.button("✅ Cevapla (Exam)", use_container_width=True):
+        ok = check_bone_answer(get_matcher(), cur.mode, bone, user)
+        if ok:
+            e["correct"] += 1
+            st.success("✅")
         else:
-            if s["cur"] is None:
-                bone = pick_weighted(s["pool"]) if s["pool"] else random.choice(BONES)
-                q, ans, mode = make_bone_question(bone)
-                s["cur"] = {"bone": bone, "q": q, "ans": ans, "mode": mode}
-
-            cur = s["cur"]
-            bone = cur["bone"]
-            st.progress((s["i"] + 1) / s["total"])
-            st.caption(f"✨ XP: {s['correct']*10}  |  🎯 Accuracy: {(s['correct']/max(1,s['i']))*100:.0f}%")
-            st.info(cur["q"])
-
-            if show_img:
-                img = bone_image_path(bone["name"])
-                if img:
-                    st.image(str(img), use_container_width=True)
-                else:
-                    st.caption("🖼️ Görsel yok. (assets/bones içine eklersen otomatik çıkar.)")
-
-            user = st.text_input("Cevabın", key=f"sk_ans_{s['i']}")
-            colA, colB = st.columns(2)
-            with colA:
-                if st.button("✅ Cevapla", use_container_width=True):
-                    ok = check_bone_answer(cur["mode"], bone, user, cur["ans"])
-                    if ok:
-                        s["correct"] += 1
-                        st.success("Doğru ✅")
-                        st.toast("🔥 Nice! +10 XP", icon="🧠")
-                    else:
-                        st.toast("😈 Almost. Review’e düştü.", icon="📌")
-                        log_wrong(USER_ID, cur["q"], user, cur["ans"])
-                    s["i"] += 1
-                    s["cur"] = None
-            with colB:
-                if st.button("⏭️ Pas", use_container_width=True):
-                    s["i"] += 1
-                    s["cur"] = None
+            st.error(f"❌ Doğru: {ans}")
+            log_wrong(USER_ID, q, user, ans, question_id(CATALOG, cur), e["uow"], tab="exam")
+        answer_review(cur, ok, e["uow"])
+        e["i"] += 1
 
-# ---------- EXAM ----------
-with tabs[1]:
+with tabs[1], timed("skull_section_seconds", section="exam_tab"):
     st.subheader("Exam Mode (Zamanlı)")
     c1, c2, c3 = st.columns(3)
     with c1:
@@ -406,62 +418,77 @@ with tabs[1]:
     with c2:
         minutes = st.number_input("Süre (dk)", 1, 60, 5)
     with c3:
-        exam_focus = st.selectbox("Kategori (exam)", ["hepsi", "neurocranium", "viscerocranium"])
+        exam_focus = st.selectbox("Kategori (exam)", ["hepsi", *CATALOG.categories])
+    exam_code = st.text_input("Deste kodu (opsiyonel)", placeholder="Aynı kod = aynı sınav (arkadaşınla kıyasla)")
 
     if "exam" not in st.session_state:
         st.session_state.exam = {"running": False}
 
     def start_exam():
-        pool = BONES[:]
-        if exam_focus != "hepsi":
-            pool = [b for b in pool if b["category"] == exam_focus]
-        st.session_state.exam = {
-            "running": True, "pool": pool, "i": 0, "total": int(exam_q), "correct": 0,
-            "cur": None, "start": time.time(), "limit": int(minutes) * 60
-        }
+        end_round(st.session_state.exam)
+        pool = BONES if exam_focus == "hepsi" else CATALOG.bones_by_category.get(exam_focus, [])
+        code = exam_code.strip()
+        seed = int(code) if code.isdigit() else None
+        # kodlu exam sadece seed'e bağlı: aynı kod + kategori + soru sayısı = aynı sınav;
+        # kodsuz exam öğrencinin seviyesine göre seçilir
+        exam = new_deck("bone", [CATALOG.bone_index[b["name"]] for b in pool or BONES], int(exam_q), seed,
+                        personal=False, adaptive=seed is None)
+        exam.update(start=time.time(), limit=int(minutes) * 60)
+        st.session_state.exam = exam
 
     colA, colB = st.columns(2)
     with colA:
         st.button("🧪 Exam başlat", on_click=start_exam, use_container_width=True)
     with colB:
         if st.button("🛑 Durdur", use_container_width=True):
+            end_round(st.session_state.exam)
             st.session_state.exam = {"running": False}
 
-    e = st.session_state.exam
-    if e.get("running"):
-        elapsed = int(time.time() - e["start"])
-        left = max(0, e["limit"] - elapsed)
-        st.write(f"⏳ Kalan süre: **{left//60:02d}:{left%60:02d}**")
-        st.progress(1 - (left / e["limit"]) if e["limit"] else 0)
-
-        if left == 0 or e["i"] >= e["total"]:
-            e["running"] = False
-            add_stats(USER_ID, e["correct"], e["total"])
-            st.error(f"🏁 Exam bitti! Skor: {e['correct']}/{e['total']}")
-        else:
-            if e["cur"] is None:
-                bone = pick_weighted(e["pool"]) if e["pool"] else random.choice(BONES)
-                q, ans, mode = make_bone_question(bone)
-                e["cur"] = {"bone": bone, "q": q, "ans": ans, "mode": mode}
-
-            cur = e["cur"]
-            bone = cur["bone"]
-            st.write(f"**Soru {e['i']+1}/{e['total']}**")
-            st.info(cur["q"])
-            user = st.text_input("Cevabın", key=f"ex_ans_{e['i']}")
-            if st.button("✅ Cevapla (Exam)", use_container_width=True):
-                ok = check_bone_answer(cur["mode"], bone, user, cur["ans"])
-                if ok:
-                    e["correct"] += 1
-                    st.success("✅")
-                else:
-                    st.error(f"❌ Doğru: {cur['ans']}")
-                    log_wrong(USER_ID, cur["q"], user, cur["ans"])
-                e["i"] += 1
-                e["cur"] = None
+    # panel önce çalışır: süre bittiyse sınavı o kapatır, sayaç da bir daha rerun tetiklemez.
+    # run_every her çağrıda kaydedildiği için sayaç sadece sınav sürerken çağrılır.
+    timer_slot = st.container()
+    exam_panel()
+    if st.session_state.exam.get("running"):
+        with timer_slot:
+            exam_timer()
 
 # ---------- CN FORAMINA ----------
-with tabs[2]:
+@st.fragment
+@timed("skull_section_seconds", section="cn_panel")
+def cn_panel():
+    cn = st.session_state.cn
+    if not cn.get("running"):
+        return
+    if cn["i"] >= cn["total"]:
+        cn["running"] = False
+        add_stats(USER_ID, cn["correct"], cn["total"], cn["uow"])
+        end_round(cn)
+        st.success(f"🏁 CN bitti! Skor: {cn['correct']}/{cn['total']}")
+        return
+
+    cur = cn["deck"][cn["i"]]
+    q, a, _ = cn["prefetch"].get(cn["i"])
+    st.write(f"**Soru {cn['i']+1}/{cn['total']}**")
+    st.info(q)
+    user = st.text_input("Cevabın", key=f"cn_ans_{cn['i']}")
+
+    colA, colB = st.columns(2)
+    with colA:
+        if st.button("✅ Cevapla (CN)", use_container_width=True):
+            ok = check_cn_answer(CATALOG, get_matcher(), cur.mode, user, a)
+            if ok:
+                cn["correct"] += 1
+                st.success("Doğru ✅")
+            else:
+                st.error(f"Yanlış ❌ Doğru: {a}")
+                log_wrong(USER_ID, q, user, a, question_id(CATALOG, cur), cn["uow"], tab="cn")
+            answer_review(cur, ok, cn["uow"])
+            cn["i"] += 1
+    with colB:
+        if st.button("⏭️ Pas (CN)", use_container_width=True):
+            cn["i"] += 1
+
+with tabs[2], timed("skull_section_seconds", section="cn_tab"):
     st.subheader("CN Foraminal Mode (Kurul)")
     st.caption("Cranial nerves ve foramina ezberi. Ağlatır ama kazandırır.")
 
@@ -469,58 +496,56 @@ with tabs[2]:
         st.session_state.cn = {"running": False}
 
     def start_cn():
-        st.session_state.cn = {"running": True, "i": 0, "total": 15, "correct": 0, "cur": None}
+        end_round(st.session_state.cn)
+        st.session_state.cn = new_deck("cn", list(range(len(CN_FORAMINA))), 15)
 
     st.button("⚡ CN Quiz Başlat", on_click=start_cn, use_container_width=True)
-
-    cn = st.session_state.cn
-    if cn.get("running"):
-        if cn["i"] >= cn["total"]:
-            cn["running"] = False
-            add_stats(USER_ID, cn["correct"], cn["total"])
-            st.success(f"🏁 CN bitti! Skor: {cn['correct']}/{cn['total']}")
-        else:
-            if cn["cur"] is None:
-                q, a, style = make_cn_question()
-                cn["cur"] = {"q": q, "a": a, "style": style}
-
-            cur = cn["cur"]
-            st.write(f"**Soru {cn['i']+1}/{cn['total']}**")
-            st.info(cur["q"])
-            user = st.text_input("Cevabın", key=f"cn_ans_{cn['i']}")
-
-            colA, colB = st.columns(2)
-            with colA:
-                if st.button("✅ Cevapla (CN)", use_container_width=True):
-                    ok = check_cn_answer(cur["style"], user, cur["a"])
-                    if ok:
-                        cn["correct"] += 1
-                        st.success("Doğru ✅")
-                    else:
-                        st.error(f"Yanlış ❌ Doğru: {cur['a']}")
-                        log_wrong(USER_ID, cur["q"], user, cur["a"])
-                    cn["i"] += 1
-                    cn["cur"] = None
-            with colB:
-                if st.button("⏭️ Pas (CN)", use_container_width=True):
-                    cn["i"] += 1
-                    cn["cur"] = None
+    cn_panel()
 
 # ---------- REVIEW ----------
-with tabs[3]:
+with tabs[3], timed("skull_section_seconds", section="review_tab"):
     st.subheader("Review (Sana özel)")
-    wrongs = get_wrongs(USER_ID)
+    index = get_review_index(USER_ID)
 
-    if not wrongs:
+    if not len(index):
         st.write("Henüz yanlış yok. Ya efsanesin ya da hiç zorlamadın. 😌")
     else:
         st.caption("Yanlış havuzu sadece sana ait. Arkadaşların seni sabote edemiyor, üzgünüm.")
-        # Son 20 yanlış
-        for item in list(reversed(wrongs[-20:])):
-            st.warning(item["q"])
-            st.write(f"Sen: **{item['user']}**")
-            st.write(f"Doğru: **{item['correct']}**")
-            st.divider()
+        text = st.text_input("🔎 Ara", placeholder="ör. sphenoid foramen", key="review_q")
+        f1, f2, f3, f4 = st.columns(4)
+        kind = f1.selectbox("Tür", ["hepsi", "kemikler", "CN / foramina"], key="review_kind")
+        days = f2.selectbox("Tarih", ["hepsi", "bugün", "son 7 gün", "son 30 gün"], key="review_days")
+        modes = f3.multiselect("Mod", index.modes(), key="review_modes")
+        origin = f4.multiselect("Sekme", index.tabs(), format_func=REVIEW_TABS.get, key="review_tabs")
+        back = {"hepsi": None, "bugün": 0, "son 7 gün": 6, "son 30 gün": 29}[days]
+        since = None if back is None else int(time.mktime(date.fromordinal(date.today().toordinal() - back).timetuple()))
+
+        # filtre değişince ilk sayfaya dön; sayfa geçmişi imleç (cursor) yığını
+        filters = (text, kind, days, tuple(modes), tuple(origin))
+        if st.session_state.get("review_filters") != filters:
+            st.session_state.review_filters = filters
+            st.session_state.review_pages = [None]
+        pages = st.session_state.review_pages
+        rows, cursor, total = index.query(text, {"hepsi": "", "kemikler": "bone:", "CN / foramina": "cn:"}[kind],
+                                          modes, origin, since, after=pages[-1])
+        if rows:
+            st.dataframe(
+                [{"soru": r["q"].replace("**", ""), "sen": r["user"], "doğru": r["correct"], "kaç kez": r["count"],
+                  "mod": r["mode"], "sekme": REVIEW_TABS.get(r["tab"], "–"),
+                  "son": time.strftime("%d.%m %H:%M", time.localtime(r["last_ts"])) if r["last_ts"] else "–"}
+                 for r in rows],
+                use_container_width=True, hide_index=True,
+            )
+        else:
+            st.caption("Bu filtreyle yanlış yok.")
+        p1, p2, p3 = st.columns([1, 2, 1])
+        if p1.button("◀ Önceki", disabled=len(pages) == 1, use_container_width=True):
+            pages.pop()
+            st.rerun()
+        p2.caption(f"Sayfa {len(pages)} · {total} sonuç ({len(index)} farklı yanlış)")
+        if p3.button("Sonraki ▶", disabled=cursor is None, use_container_width=True):
+            pages.append(cursor)
+            st.rerun()
 
         colA, colB = st.columns(2)
         with colA:
@@ -530,11 +555,28 @@ with tabs[3]:
         with colB:
             st.caption("İstersen Export ile arkadaşına kendi progress’ını bile yollarsın.")
 
+@st.cache_data(max_entries=256)
+def heatmap_html(grid: tuple[tuple[int | None, ...], ...]) -> str:
+    # GitHub tarzı ısı haritası: sütun = hafta, satır = gün; HTML aynı ızgara için bir kez üretilir
+    top = max((n for week in grid for n in week if n), default=1)
+    cells = "".join(
+        "<i></i>" if n is None else f'<i class="l{0 if not n else 1 + min(3, n * 4 // (top + 1))}" title="{n}"></i>'
+        for week in grid for n in week
+    )
+    return f'<div class="heatmap">{cells}</div>'
+
 # ---------- STATS ----------
-with tabs[4]:
+with tabs[4], timed("skull_section_seconds", section="stats_tab"):
     st.subheader("Stats (Sana özel)")
     rec = get_user_record(USER_ID)
-    st.metric("🔥 Streak", rec.get("streak", 0))
+    act = rec.get("activity")
+    today = date.today().toordinal()
+    s1, s2, s3 = st.columns(3)
+    s1.metric("🔥 Streak", current_streak(act, today))
+    s2.metric("En uzun seri", act["best"] if act else 0)
+    s3.metric("Aktif gün", active_days(act))
+    if act:
+        st.markdown(heatmap_html(tuple(map(tuple, heatmap(act, today)))), unsafe_allow_html=True)
     c = rec["stats"]["correct"]
     t = rec["stats"]["total"]
     st.metric("Toplam Doğru / Toplam Soru", f"{c}/{t}")
@@ -547,20 +589,46 @@ with tabs[4]:
             reset_stats(USER_ID)
             st.success("Sıfırlandı.")
   
-def bump_streak(uid: str):
-    rec = get_user_record(uid)
-    today = str(date.today())
-    last = rec.get("last_day")
-    streak = int(rec.get("streak", 0))
-
-    if last == today:
-        rec["streak"] = streak
-    else:
-        # dün müydü? (basit yaklaşım)
-        # eğer dün değilse streak sıfırlanır
-        rec["streak"] = streak + 1 if last else 1
-        rec["last_day"] = today
-
-    update_user_record(uid, rec)
-         
-
+# ---------- SINIF (eğitmen) ----------
+if is_admin:
+    with tabs[5], timed("skull_section_seconds", section="cohort_tab"):
+        st.subheader("Sınıf analitiği")
+        st.caption("Cevaplar yazılırken güncellenen özetler; tüm kullanıcıları taramaz (birkaç saniye gecikmeli).")
+        cohort = STORE.get(COHORT_ID) or {}
+        answers = cohort.get("answers", 0)
+        c1, c2 = st.columns(2)
+        c1.metric("Sınıf doğruluğu", f"{cohort.get('correct', 0) / answers * 100:.0f}%" if answers else "–")
+        c2.metric("Toplam cevap", answers)
+
+        acc = mode_accuracy(cohort)
+        if acc:
+            st.write("**Mod bazında doğruluk**")
+            st.dataframe([{"mod": m, "doğruluk": f"{a * 100:.0f}%"} for m, a in sorted(acc.items())], use_container_width=True)
+
+        kind = st.radio("En çok kaçırılanlar", ["hepsi", "kemikler", "CN / foramina"], horizontal=True)
+        prefix = {"hepsi": "", "kemikler": "bone:", "CN / foramina": "cn:"}[kind]
+        rows = hardest(cohort, prefix)
+        if rows:
+            st.dataframe([{"soru": r["item"].split(":", 1)[1], "mod": r["mode"], "deneme": r["attempts"],
+                           "yanlış": r["misses"], "yanlış oranı": f"{r['miss_rate'] * 100:.0f}%"} for r in rows],
+                         use_container_width=True)
+        else:
+            st.caption("Henüz yeterli cevap yok (soru başına en az 5).")
+
+        st.write("**Soru zorluğu kalibrasyonu**")
+        cal = STORE.get(CALIBRATION_ID)
+        if cal:
+            st.caption(f"Son: {time.strftime('%d.%m.%Y %H:%M', time.localtime(cal['fitted_at']))} · "
+                       f"{cal['students']} öğrenci, {cal['answers']} cevap, {cal['seconds']} sn")
+        if st.button("🎯 Zorlukları yeniden hesapla", use_container_width=True):
+            JOURNAL.compact()
+            cal, _ = calibrate(STORE)
+            st.success(f"{len(cal['difficulty'])} soru kalibre edildi ({cal['seconds']} sn).")
+
+        st.write(f"**Bu haftanın ilk {len(cohort.get('leaderboard', []))}'u** ({cohort.get('week') or '–'})")
+        board = leaderboard(cohort)
+        if board:
+            st.dataframe([{"kullanıcı": b["uid"], "doğru": b["correct"], "cevap": b["answers"]} for b in board],
+                         use_container_width=True)
+
+get_run_times().record(time.perf_counter() - _run_started)
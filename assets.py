@@ -0,0 +1,114 @@
+"""
+Bone image pipeline: a manifest of assets/bones built once, resized WebP variants
+generated ahead of time, and a size-capped in-memory cache of image bytes.
+
+    python assets.py   # pre-build the variants (the app also builds missing ones at startup)
+"""
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from metrics import inc, timed
+
+try:
+    from PIL import Image
+except ImportError:  # no Pillow: serve the original files
+    Image = None
+
+log = logging.getLogger("skull_trainer")
+
+VARIANT_WIDTHS = (320, 640, 960)
+SOURCE_SUFFIXES = (".png", ".jpg")  # in order of preference, like the old bone_image_path
+
+
+class ImageAssets:
+    def __init__(self, src_dir: Path, cache_dir: Path, widths: tuple[int, ...] = VARIANT_WIDTHS,
+                 max_bytes: int = 16 * 1024 * 1024):
+        self.src_dir = Path(src_dir)
+        self.cache_dir = Path(cache_dir)
+        self.widths = widths
+        self.max_bytes = max_bytes
+        self.manifest: dict[str, list[tuple[int, Path]]] = {}  # name -> [(width, path)] sorted by width
+        self._bytes: OrderedDict[Path, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.build()
+
+    def build(self) -> None:
+        """Scan the source dir once and create any missing/outdated variants."""
+        manifest: dict[str, list[tuple[int, Path]]] = {}
+        if self.src_dir.is_dir():
+            sources: dict[str, Path] = {}
+            for p in self.src_dir.iterdir():
+                if p.suffix.lower() in SOURCE_SUFFIXES:
+                    stem = p.stem.lower()
+                    if stem not in sources or SOURCE_SUFFIXES.index(p.suffix.lower()) < SOURCE_SUFFIXES.index(sources[stem].suffix.lower()):
+                        sources[stem] = p
+            for stem, src in sources.items():
+                try:
+                    manifest[stem] = self._variants(stem, src)
+                except Exception:  # one unreadable file only costs its own bone the image
+                    log.exception("bone image %s skipped", src)
+        self.manifest = manifest
+
+    def _variants(self, stem: str, src: Path) -> list[tuple[int, Path]]:
+        if Image is None:
+            return [(0, src)]
+        with Image.open(src) as im:
+            full_w = im.width
+            out = []
+            for w in self.widths:
+                if w >= full_w:
+                    break
+                dst = self.cache_dir / f"{stem}-{w}.webp"
+                if not dst.exists() or dst.stat().st_mtime < src.stat().st_mtime:
+                    dst.parent.mkdir(parents=True, exist_ok=True)
+                    small = im.convert("RGBA") if im.mode not in ("RGB", "RGBA") else im.copy()
+                    small.thumbnail((w, w * im.height // full_w))
+                    small.save(dst, "WEBP", quality=80, method=6)
+                out.append((w, dst))
+        out.append((full_w, src))
+        return out
+
+    def path(self, name: str, width: int | None = None) -> Path | None:
+        """Smallest variant at least `width` wide (the original if none is)."""
+        variants = self.manifest.get(name.lower())
+        if not variants:
+            return None
+        if width is not None:
+            for w, p in variants:
+                if w >= width:
+                    return p
+        return variants[-1][1]
+
+    @timed("skull_image_load_seconds")
+    def image_bytes(self, name: str, width: int | None = None) -> bytes | None:
+        p = self.path(name, width)
+        if p is None:
+            return None
+        with self._lock:
+            data = self._bytes.get(p)
+            if data is not None:
+                self._bytes.move_to_end(p)
+        if data is not None:
+            inc("skull_image_cache_total", result="hit")
+            inc("skull_image_bytes_total", len(data))
+            return data
+        data = p.read_bytes()
+        inc("skull_image_cache_total", result="miss")
+        inc("skull_image_bytes_total", len(data))
+        with self._lock:
+            if p not in self._bytes:
+                self._bytes[p] = data
+                self._size += len(data)
+                while self._size > self.max_bytes and len(self._bytes) > 1:
+                    _, dropped = self._bytes.popitem(last=False)
+                    self._size -= len(dropped)
+        return data
+
+
+if __name__ == "__main__":
+    assets = ImageAssets(Path("assets/bones"), Path("assets/.cache/bones"))
+    for name, variants in sorted(assets.manifest.items()):
+        print(name, " ".join(f"{w}px" for w, _ in variants))
@@ -0,0 +1,532 @@
+"""
+Headless benchmarks, printed as JSON so runs of different versions can be compared:
+
+- reruns: app.py driven through Streamlit's AppTest. Measures full reruns and the answer
+  reruns of the Skull Quiz / Exam / CN tabs, for users with short, median and long histories.
+- storage: the journal/store calls behind add_stats, log_wrong and get_user_record, from
+  several processes sharing one data dir.
+- replicas: several processes sharing one data dir (like app replicas behind a load
+  balancer) write the same users; checks that no answer and no compare-and-swap
+  update is lost.
+- calibration: the cohort-wide difficulty/ability fit on synthetic answers.
+- history: cost of a long wrong history. This covers the migrations (qid backfill, trim),
+  record (de)serialization, wrong_weights and deck generation, by history length.
+
+    python bench.py fixture bench-data --users 10000 --max-wrongs 10000
+    python bench.py run --fixture bench-data -o before.json
+    python bench.py compare before.json after.json
+"""
+import argparse
+import atexit
+import copy
+import json
+import multiprocessing as mp
+import os
+import platform
+import queue
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+import config
+from bulk import import_lines
+from catalog import load_catalog
+from deck import BONE_MODES, CN_STYLES, generate_deck, item_id
+from journal import AnswerJournal, trim_wrongs
+from metrics import METRICS
+from questions import backfill_question_ids, bone_qid, cn_qid, make_bone_question, make_cn_question, miss_weights
+from storage import CachedUserStore, new_record, open_store
+
+APP = Path(__file__).with_name("app.py")
+HISTORY_SIZES = (0, 10, 100, 1_000, 10_000)
+
+# (tab, start button, answer input key prefix, answer button)
+TAB_FLOWS = (
+    ("skull", "🚀 Yeni Quiz Başlat", "sk_ans_", "✅ Cevapla"),
+    ("exam", "🧪 Exam başlat", "ex_ans_", "✅ Cevapla (Exam)"),
+    ("cn", "⚡ CN Quiz Başlat", "cn_ans_", "✅ Cevapla (CN)"),
+)
+
+
+def summarize(seconds: list[float]) -> dict:
+    if not seconds:
+        return {"n": 0}
+    ms = sorted(s * 1000 for s in seconds)
+    pick = lambda p: round(ms[min(len(ms) - 1, int(p * len(ms)))], 3)
+    return {"n": len(ms), "p50_ms": pick(0.5), "p95_ms": pick(0.95), "mean_ms": round(sum(ms) / len(ms), 3)}
+
+
+def section_stats(before: dict, after: dict) -> dict:
+    """skull_section_seconds observed between two `METRICS.histograms` copies, per section.
+    Percentiles are histogram bucket bounds; mean_ms is exact."""
+    out = {}
+    for labels, h in sorted(after.items()):
+        h = h.since(before.get(labels))
+        if h.count:
+            ms = lambda s: round(s * 1000, 3)
+            out[dict(labels)["section"]] = {"n": h.count, "p50_ms": ms(h.quantile(0.5)),
+                                            "p95_ms": ms(h.quantile(0.95)), "mean_ms": ms(h.sum / h.count)}
+    return out
+
+
+# -------------------- FIXTURES --------------------
+def question_pool(catalog) -> list[tuple[str, str, str]]:
+    """(qid, question text, correct answer) for every question the quizzes can ask."""
+    pool = []
+    for b in catalog.bones:
+        for mode in BONE_MODES:
+            pool.append((bone_qid(b["name"], mode), *make_bone_question(catalog, b, mode)))
+    for c in catalog.cn_foramina:
+        for style in CN_STYLES:
+            pool.append((cn_qid(c["cn"], style), *make_cn_question(c, style)))
+    return pool
+
+
+def synthetic_record(pool: list, rng: random.Random, n_wrongs: int, keep: int | None = config.WRONGS_KEEP,
+                     with_qid: bool = True) -> dict:
+    """
+    A user with `n_wrongs` wrong answers. With `keep`, the record is built the way the app
+    stores it (wrongs trimmed, older ones in the archive and the misses counters);
+    keep=None gives a legacy record with the whole raw history.
+    """
+    rec = new_record()
+    ts = int(time.time()) - n_wrongs * 60
+    chunk: list[dict] = []
+    for k in range(n_wrongs):
+        qid, q, correct = pool[rng.randrange(len(pool))]
+        w = {"q": q, "user": "x", "correct": correct, "ts": ts + k * 60}
+        if with_qid:
+            w["qid"] = qid
+            rec["misses"][qid] = rec["misses"].get(qid, 0) + 1
+        chunk.append(w)
+        if keep is not None and len(chunk) >= keep:
+            rec["wrongs"] += chunk
+            chunk = []
+            trim_wrongs(rec, keep)
+    rec["wrongs"] += chunk
+    if keep is not None:
+        trim_wrongs(rec, keep)
+    if not with_qid:
+        del rec["misses"]
+    total = n_wrongs * 3
+    rec["stats"] = {"correct": total - n_wrongs, "total": total}
+    return rec
+
+
+def history_sizes(rng: random.Random, users: int, max_wrongs: int) -> list[int]:
+    # log-uniform in [0, max_wrongs]: most students have short histories, a few very long ones
+    return [int((max_wrongs + 1) ** rng.random()) - 1 for _ in range(users)]
+
+
+def make_fixture(out: Path, users: int, max_wrongs: int, fmt: str = "sqlite", seed: int = 1) -> dict:
+    """
+    Write `out/data/users.db` (as the app stores it) or `out/data/users.json` (legacy,
+    raw histories) plus `out/fixture.json` with the parameters and sample users.
+    """
+    rng = random.Random(seed)
+    pool = question_pool(load_catalog(config.PACKS_DIR))
+    sizes = history_sizes(rng, users, max_wrongs)
+    uids = [f"u{i:06d}" for i in range(users)]
+    data = out / "data"
+    data.mkdir(parents=True, exist_ok=True)
+    t = time.perf_counter()
+    if fmt == "json":
+        with open(data / "users.json", "w", encoding="utf-8") as f:
+            f.write("{")
+            for i, (uid, n) in enumerate(zip(uids, sizes)):
+                rec = synthetic_record(pool, rng, n, keep=None, with_qid=False)
+                f.write(("," if i else "") + json.dumps(uid) + ":" + json.dumps(rec, ensure_ascii=False))
+            f.write("}")
+    else:
+        lines = (json.dumps({"uid": uid, "data": synthetic_record(pool, rng, n)}, ensure_ascii=False)
+                 for uid, n in zip(uids, sizes))
+        import_lines(lines, open_store(data / "users.db"))
+    by_size = sorted(zip(sizes, uids))
+    meta = {
+        "users": users, "max_wrongs": max_wrongs, "format": fmt, "seed": seed,
+        "total_wrongs": sum(sizes), "build_s": round(time.perf_counter() - t, 2),
+        "samples": {"short": by_size[0][1], "median": by_size[len(by_size) // 2][1], "long": by_size[-1][1]},
+        "sample_wrongs": {"short": by_size[0][0], "median": by_size[len(by_size) // 2][0], "long": by_size[-1][0]},
+    }
+    (out / "fixture.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    return meta
+
+
+# -------------------- RERUNS --------------------
+def _click(at, label: str) -> bool:
+    for b in at.button:
+        if b.label == label:
+            b.click()
+            return True
+    return False
+
+
+def _answer_input(at, prefix: str):
+    for t in at.text_input:
+        if t.key and t.key.startswith(prefix):
+            return t
+    return None
+
+
+def bench_reruns(workdir: Path, samples: dict[str, str], reps: int) -> dict:
+    """Wall time of AppTest runs; includes AppTest's own overhead, so compare runs, not absolutes."""
+    from streamlit.testing.v1 import AppTest
+
+    os.chdir(workdir)
+    out: dict = {}
+    for label, uid in samples.items():
+        at = AppTest.from_file(str(APP), default_timeout=120)
+        at.query_params["u"] = uid
+        t = time.perf_counter()
+        at.run()
+        res: dict = {"uid": uid, "first_run_ms": round((time.perf_counter() - t) * 1000, 1)}
+        if at.exception:
+            raise RuntimeError(f"app.py failed for {uid}: {at.exception}")
+
+        idle = []
+        before = METRICS.histograms("skull_section_seconds")
+        for _ in range(reps):
+            t = time.perf_counter()
+            at.run()
+            idle.append(time.perf_counter() - t)
+        res["full_rerun"] = summarize(idle)  # sidebar + every tab (Review and Stats included)
+        # per tab/section share of those reruns, from the app's own section timers
+        res["sections"] = section_stats(before, METRICS.histograms("skull_section_seconds"))
+
+        for tab, start, prefix, answer in TAB_FLOWS:
+            times = []
+            while len(times) < reps:
+                box = _answer_input(at, prefix)
+                if box is None:  # no round running / round over: start a new one
+                    _click(at, start)
+                    at.run()
+                    box = _answer_input(at, prefix)
+                    if box is None:
+                        break
+                box.input("x")
+                if not _click(at, answer):
+                    break
+                t = time.perf_counter()
+                at.run()
+                times.append(time.perf_counter() - t)
+            res[f"{tab}_answer"] = summarize(times)
+        out[label] = res
+
+    import services  # same process as the AppTest runs, so this is the app's own timer
+    out["script_run_times"] = services.get_run_times().summary()
+    return out
+
+
+# -------------------- STORAGE --------------------
+def _storage_worker(db: str, journal_dir: str, uids: list[str], ops: int, barrier, results) -> None:
+    store = CachedUserStore(open_store(Path(db)), max_bytes=config.USER_CACHE_MAX_BYTES)
+    journal = AnswerJournal(Path(journal_dir), store, wrongs_keep=config.WRONGS_KEEP)
+    rng = random.Random(os.getpid())
+    times: dict[str, list[float]] = {"get_user_record": [], "add_stats": [], "log_wrong": []}
+    barrier.wait()
+    start = time.perf_counter()
+    for _ in range(ops):
+        uid = rng.choice(uids)
+        # the same calls (and events) as the helpers in app.py, one "rerun" per op
+        t = time.perf_counter()
+        store.sync()
+        journal.view(uid)
+        times["get_user_record"].append(time.perf_counter() - t)
+        t = time.perf_counter()
+        journal.append(uid, {"t": "stats", "correct": 1, "total": 2})
+        times["add_stats"].append(time.perf_counter() - t)
+        t = time.perf_counter()
+        journal.append(uid, {"t": "wrong", "q": "bench", "user": "x", "correct": "y", "ts": int(time.time()), "qid": None})
+        times["log_wrong"].append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    t = time.perf_counter()
+    journal.close()  # folds what the background compactor hasn't yet
+    results.put({"elapsed": elapsed, "close": time.perf_counter() - t, "times": times})
+
+
+def bench_storage(workdir: Path, uids: list[str], procs: list[int], ops: int) -> dict:
+    ctx = mp.get_context("spawn")
+    db = workdir / "data" / "users.db"
+    out = {}
+    for p in procs:
+        barrier, results = ctx.Barrier(p), ctx.Queue()
+        workers = [ctx.Process(target=_storage_worker, args=(str(db), str(workdir / "data" / "journal"), uids, ops, barrier, results))
+                   for _ in range(p)]
+        for w in workers:
+            w.start()
+        parts = [results.get() for _ in workers]
+        for w in workers:
+            w.join()
+        wall = max(r["elapsed"] for r in parts)
+        res: dict = {"processes": p, "ops_per_process": ops}
+        for name in ("get_user_record", "add_stats", "log_wrong"):
+            samples = [s for r in parts for s in r["times"][name]]
+            res[name] = {**summarize(samples), "ops_per_s": round(len(samples) / wall, 1)}
+        res["close_fold"] = summarize([r["close"] for r in parts])
+        out[f"{p}_proc"] = res
+    return out
+
+
+# -------------------- REPLICAS --------------------
+REPLICA_COUNTER = "__bench_counter__"
+
+
+def _replica_worker(db: str, journal_dir: str, uids: list[str], ops: int, cas_every: int, barrier, results) -> None:
+    # one "replica": its own store cache and journal over the shared data dir
+    store = CachedUserStore(open_store(Path(db)), max_bytes=config.USER_CACHE_MAX_BYTES)
+    journal = AnswerJournal(Path(journal_dir), store, wrongs_keep=config.WRONGS_KEEP)
+    rng = random.Random(os.getpid())
+    cas: list[float] = []
+    barrier.wait()
+    start = time.perf_counter()
+    for i in range(ops):
+        store.sync()
+        journal.append(rng.choice(uids), {"t": "stats", "correct": 1, "total": 1})
+        if i % cas_every == 0:
+            t = time.perf_counter()
+            store.update_optimistic(REPLICA_COUNTER, lambda rec: rec.update(n=rec.get("n", 0) + 1))
+            cas.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    journal.close()
+    conflicts = sum(c["value"] for c in METRICS.snapshot()[1] if c["metric"] == "skull_storage_conflicts_total")
+    results.put({"elapsed": elapsed, "cas": cas, "conflicts": conflicts})
+
+
+def bench_replicas(workdir: Path, procs: int, ops: int, users: int = 20, cas_every: int = 10) -> dict:
+    """
+    Several processes append answers for the same few users and bump one shared counter
+    with compare-and-swap. Nothing may be lost: every answer and every increment must
+    be in the store at the end.
+    """
+    ctx = mp.get_context("spawn")
+    data = workdir / "replicas"
+    data.mkdir()
+    db = data / "users.db"
+    uids = [f"r{i:03d}" for i in range(users)]
+    barrier, results = ctx.Barrier(procs), ctx.Queue()
+    workers = [ctx.Process(target=_replica_worker, args=(str(db), str(data / "journal"), uids, ops, cas_every, barrier, results))
+               for _ in range(procs)]
+    for w in workers:
+        w.start()
+    parts = []
+    while len(parts) < procs:
+        try:
+            parts.append(results.get(timeout=1))
+        except queue.Empty:
+            dead = [w.exitcode for w in workers if w.exitcode not in (None, 0)]
+            if dead:  # the others would wait at the barrier (or for its result) forever
+                for w in workers:
+                    w.kill()
+                raise RuntimeError(f"replica worker exited with {dead[0]}")
+    for w in workers:
+        w.join()
+    store = open_store(db)
+    answers = sum((store.get(uid) or new_record())["stats"]["total"] for uid in uids)
+    counter = (store.get(REPLICA_COUNTER) or {}).get("n", 0)
+    wall = max(r["elapsed"] for r in parts)
+    counter_expected = sum(len(r["cas"]) for r in parts)
+    return {
+        "processes": procs, "ops_per_process": ops,
+        "lost": answers != procs * ops or counter != counter_expected,
+        "answers": answers, "answers_expected": procs * ops,
+        "counter": counter, "counter_expected": counter_expected,
+        "cas_conflicts": sum(r["conflicts"] for r in parts),
+        "cas": summarize([s for r in parts for s in r["cas"]]),
+        "answers_per_s": round(procs * ops / wall, 1),
+    }
+
+
+# -------------------- HISTORY --------------------
+def _timed(fn, reps: int, setup=None) -> dict:
+    """`fn()`, or `fn(setup())` with the untimed setup giving a fresh argument each time."""
+    samples = []
+    for _ in range(reps):
+        arg = setup() if setup else None
+        t = time.perf_counter()
+        fn(arg) if setup else fn()
+        samples.append(time.perf_counter() - t)
+    return summarize(samples)
+
+
+def bench_history(sizes: tuple[int, ...] = HISTORY_SIZES, reps: int = 5) -> dict:
+    catalog = load_catalog(config.PACKS_DIR)
+    pool = question_pool(catalog)
+    rng = random.Random(1)
+    items = [item_id(catalog, "bone", i) for i in range(len(catalog.bones))]
+    out = {}
+    for n in sizes:
+        legacy = synthetic_record(pool, rng, n, keep=None, with_qid=False)
+        stored = synthetic_record(pool, rng, n)
+        raw = json.dumps(stored, ensure_ascii=False)
+        weights = miss_weights(stored["misses"], items, BONE_MODES)
+        out[str(n)] = {
+            "legacy_bytes": len(json.dumps(legacy, ensure_ascii=False)),
+            "stored_bytes": len(raw),
+            "migrate_backfill": _timed(partial(backfill_question_ids, catalog), reps, partial(copy.deepcopy, legacy)),
+            "migrate_trim": _timed(lambda rec: trim_wrongs(rec, config.WRONGS_KEEP), reps, partial(copy.deepcopy, legacy)),
+            "record_load": _timed(lambda: json.loads(raw), reps),
+            "record_dump": _timed(lambda: json.dumps(stored, ensure_ascii=False), reps),
+            "wrong_weights": _timed(lambda: miss_weights(stored["misses"], items, BONE_MODES), reps),
+            "generate_deck": _timed(lambda: generate_deck(catalog, "bone", list(range(len(items))), 10, 1, {}, weights), reps),
+        }
+    return out
+
+
+# -------------------- CALIBRATION --------------------
+def bench_calibration(users: int, questions: int = 300, answers_per_cell: float = 7.0, seed: int = 1) -> dict:
+    """The Rasch fit on synthetic counts drawn from known parameters (a semester is ~users x questions cells)."""
+    import numpy as np
+
+    from calibrate import fit
+
+    rng = np.random.default_rng(seed)
+    theta, b = rng.normal(0, 1, users), rng.normal(0, 1.2, questions)
+    u, q = np.repeat(np.arange(users), questions), np.tile(np.arange(questions), users)
+    n = rng.poisson(answers_per_cell, u.size)
+    k = rng.binomial(n, 1 / (1 + np.exp(b[q] - theta[u])))
+    keep = n > 0
+    u, q, n, k = u[keep], q[keep], n[keep].astype(float), k[keep].astype(float)
+    t = time.perf_counter()
+    fit_theta, fit_b, iters = fit(u, q, n, k, users, questions)
+    return {
+        "cells": int(u.size), "answers": int(n.sum()), "iterations": iters,
+        "fit_ms": round((time.perf_counter() - t) * 1000, 1),
+        "difficulty_corr": round(float(np.corrcoef(fit_b, b)[0, 1]), 4),
+        "ability_corr": round(float(np.corrcoef(fit_theta, theta)[0, 1]), 4),
+    }
+
+
+# -------------------- COMPARE --------------------
+def _flatten(d: dict, prefix: str = "") -> dict[str, float]:
+    out = {}
+    for k, v in d.items():
+        key = f"{prefix}.{k}" if prefix else k
+        if isinstance(v, dict):
+            out.update(_flatten(v, key))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[key] = v
+    return out
+
+
+def compare(old: dict, new: dict, threshold: float) -> list[str]:
+    """Metrics (latency up / throughput down) that got worse by more than `threshold`x."""
+    a, b = _flatten(old["results"]), _flatten(new["results"])
+    worse = []
+    for key in sorted(a.keys() & b.keys()):
+        if not a[key]:
+            continue
+        ratio = b[key] / a[key]
+        if key.endswith("_ms"):
+            bad = ratio > threshold
+        elif key.endswith("ops_per_s"):
+            bad = ratio < 1 / threshold
+        else:
+            continue
+        print(f"{'!!' if bad else '  '} {key:70s} {a[key]:>12} {b[key]:>12}  x{ratio:.2f}")
+        if bad:
+            worse.append(key)
+    return worse
+
+
+# -------------------- CLI --------------------
+def _git_rev() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> dict:
+    import streamlit
+
+    only = set(args.only.split(","))
+    results: dict = {}
+    work = Path(tempfile.mkdtemp(prefix="skull-bench-"))
+    # the app's data paths are relative to the cwd (bench_reruns moves into `work`), and its
+    # journal and writer flush there from their own atexit hooks, so remove it only after those
+    atexit.register(shutil.rmtree, work, True)
+    fixture = None
+    if args.fixture:
+        shutil.copytree(Path(args.fixture) / "data", work / "data")
+        fixture = json.loads((Path(args.fixture) / "fixture.json").read_text(encoding="utf-8"))
+    elif only & {"reruns", "storage"}:  # the other sections bring their own data
+        fixture = make_fixture(work, args.users, args.max_wrongs)
+    if fixture:
+        results["fixture"] = fixture
+    if "history" in only:
+        results["history"] = bench_history(reps=args.reps)
+    if "calibration" in only:
+        results["calibration"] = bench_calibration(fixture["users"] if fixture else args.users)
+    if "storage" in only:
+        uids = [f"u{i:06d}" for i in range(fixture["users"])]
+        results["storage"] = bench_storage(work, uids, sorted({1, args.procs}), args.ops)
+    if "replicas" in only:
+        results["replicas"] = bench_replicas(work, args.procs, args.ops)
+    if "reruns" in only:
+        results["reruns"] = bench_reruns(work, fixture["samples"], args.reps)
+    return {
+        "meta": {"git": _git_rev(), "python": platform.python_version(), "platform": platform.platform(),
+                 "streamlit": streamlit.__version__, "cpus": os.cpu_count(), "started": int(time.time()),
+                 "args": {k: v for k, v in vars(args).items() if k != "func"}},
+        "results": results,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Skull Trainer benchmarks (JSON output).")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    fx = sub.add_parser("fixture", help="write a synthetic data dir")
+    fx.add_argument("out", type=Path)
+    fx.add_argument("--users", type=int, default=10_000)
+    fx.add_argument("--max-wrongs", type=int, default=10_000)
+    fx.add_argument("--format", choices=("sqlite", "json"), default="sqlite",
+                    help="json: legacy users.json with raw histories (large)")
+    r = sub.add_parser("run", help="run the benchmarks")
+    r.add_argument("--fixture", help="data dir from 'bench.py fixture' (default: build one)")
+    r.add_argument("--users", type=int, default=10_000)
+    r.add_argument("--max-wrongs", type=int, default=10_000)
+    r.add_argument("--only", default="reruns,storage,replicas,history,calibration")
+    r.add_argument("--reps", type=int, default=20)
+    r.add_argument("--procs", type=int, default=4)
+    r.add_argument("--ops", type=int, default=2_000)
+    r.add_argument("-o", "--output", help="write JSON here instead of stdout")
+    c = sub.add_parser("compare", help="compare two result files")
+    c.add_argument("old")
+    c.add_argument("new")
+    c.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args(argv)
+
+    if getattr(args, "fixture", None):
+        args.fixture = str(Path(args.fixture).resolve())
+    if args.cmd == "fixture":
+        print(json.dumps(make_fixture(args.out, args.users, args.max_wrongs, args.format), indent=2))
+        return 0
+    if args.cmd == "compare":
+        load = lambda p: json.loads(Path(p).read_text(encoding="utf-8"))
+        worse = compare(load(args.old), load(args.new), args.threshold)
+        print(f"{len(worse)} metric(s) worse than x{args.threshold}", file=sys.stderr)
+        return 1 if worse else 0
+
+    output = Path(args.output).resolve() if args.output else None  # run() changes the cwd
+    out = run(args)
+    text = json.dumps(out, indent=2)
+    if output:
+        output.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    replicas = out["results"].get("replicas")
+    if replicas and replicas["lost"]:
+        print(f"replicas: {replicas['answers']}/{replicas['answers_expected']} answers, "
+              f"{replicas['counter']}/{replicas['counter_expected']} increments", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
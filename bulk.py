@@ -0,0 +1,147 @@
+"""
+Cohort-wide progress export/import as NDJSON, one {"uid", "data"} object per line.
+
+Both directions stream: export walks the store with a cursor, import validates line by
+line and writes in batches, so memory stays flat no matter how many students there are.
+
+    python bulk.py export > cohort.ndjson
+    python bulk.py import cohort.ndjson
+"""
+import argparse
+import json
+import sys
+from functools import partial
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+import config
+from catalog import Catalog, load_catalog
+from journal import trim_wrongs
+from questions import backfill_question_ids
+from storage import UserStore, is_user_id, open_store
+
+
+def validate_record(data) -> str | None:
+    """Schema check shared by the single-user and bulk import. None if the record is fine."""
+    if not isinstance(data, dict):
+        return "JSON formatı tanınmadı. (data yok)"
+    if "stats" not in data or "wrongs" not in data:
+        return "JSON formatı tanınmadı. (stats/wrongs eksik)"
+    if not isinstance(data["stats"], dict) or not isinstance(data["wrongs"], list):
+        return "JSON formatı bozuk."
+    if not all(_is_int(data["stats"].get(k)) for k in ("correct", "total")):
+        return "JSON formatı bozuk. (stats.correct/total sayı değil)"
+    for i, w in enumerate(data["wrongs"]):
+        if not isinstance(w, dict) or not all(isinstance(w.get(k), str) for k in ("q", "user", "correct")):
+            return f"JSON formatı bozuk. (wrongs[{i}]: q/user/correct eksik)"
+        if not isinstance(w.get("qid"), (str, type(None))) or not isinstance(w.get("ts"), (int, float, type(None))):
+            return f"JSON formatı bozuk. (wrongs[{i}]: qid/ts hatalı)"
+    misses = data.get("misses", {})
+    if not isinstance(misses, dict) or not all(_is_int(v) for v in misses.values()):
+        return "JSON formatı bozuk. (misses)"
+    return None
+
+
+def _is_int(v) -> bool:
+    return isinstance(v, int) and not isinstance(v, bool)
+
+
+def prepare_record(catalog: Catalog, data: dict, keep: int = config.WRONGS_KEEP) -> None:
+    """
+    What every import runs before writing (app and CLI): tag old wrongs with question ids
+    and rebuild the miss counters (the migration for that has already run), then trim.
+    """
+    backfill_question_ids(catalog, data)
+    trim_wrongs(data, keep)
+
+
+def export_lines(store: UserStore) -> Iterator[str]:
+    for uid, rec in store.items():
+        yield json.dumps({"uid": uid, "data": rec}, ensure_ascii=False) + "\n"
+
+
+def _replacer(data: dict) -> Callable[[dict], None]:
+    def replace(rec: dict) -> None:
+        rec.clear()
+        rec.update(data)
+    return replace
+
+
+def import_lines(lines: Iterable[str], store: UserStore, batch_size: int = 500,
+                 prepare: Callable[[dict], object] | None = None,
+                 max_errors: int = 100) -> tuple[int, int, list[tuple[int, str]]]:
+    """
+    Validate and import NDJSON lines, `batch_size` users per transaction.
+    Returns (imported, skipped, errors); errors lists the first `max_errors` bad lines.
+    """
+    imported = skipped = 0
+    errors: list[tuple[int, str]] = []
+    batch: dict[str, Callable[[dict], None]] = {}
+    for no, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            payload = json.loads(line)
+        except json.JSONDecodeError:
+            err = "JSON okunamadı. (format hatalı)"
+        else:
+            if not isinstance(payload, dict):
+                err = "JSON formatı tanınmadı."
+            elif not isinstance(payload.get("uid"), str) or not payload["uid"].strip():
+                err = "uid eksik."
+            elif not is_user_id(payload["uid"].strip()):
+                err = "uid geçersiz."
+            else:
+                err = validate_record(payload.get("data"))
+        if err:
+            skipped += 1
+            if len(errors) < max_errors:
+                errors.append((no, err))
+            continue
+        data = payload["data"]
+        if prepare is not None:
+            try:
+                prepare(data)
+            except Exception as e:  # one odd record must not abort the whole import
+                skipped += 1
+                if len(errors) < max_errors:
+                    errors.append((no, f"Kayıt hazırlanamadı. ({type(e).__name__})"))
+                continue
+        batch[payload["uid"].strip()] = _replacer(data)
+        if len(batch) >= batch_size:
+            store.update_many(batch)
+            imported += len(batch)
+            batch = {}
+    if batch:
+        store.update_many(batch)
+        imported += len(batch)
+    return imported, skipped, errors
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk export/import of Skull Trainer progress (NDJSON).")
+    parser.add_argument("--db", type=Path, default=Path("data/users.db"))
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("export", help="write every user as NDJSON to stdout")
+    imp = sub.add_parser("import", help="read NDJSON users from a file ('-' for stdin)")
+    imp.add_argument("file")
+    imp.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    store = open_store(args.db)
+    if args.cmd == "export":
+        sys.stdout.writelines(export_lines(store))
+        return 0
+
+    f = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+    with f:
+        prepare = partial(prepare_record, load_catalog(config.PACKS_DIR))
+        imported, skipped, errors = import_lines(f, store, args.batch_size, prepare=prepare)
+    for no, err in errors:
+        print(f"satır {no}: {err}", file=sys.stderr)
+    print(f"{imported} kullanıcı import edildi, {skipped} satır atlandı.", file=sys.stderr)
+    return 1 if skipped else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
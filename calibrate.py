@@ -0,0 +1,132 @@
+"""
+Item-response calibration over the whole cohort (Rasch / 1PL model):
+
+    P(correct) = sigmoid(ability[student] - difficulty[question])
+
+Every user record counts its answers per question id (rec["attempts"]: qid ->
+[answers, correct], kept up to date by the journal). The job stacks those counts into
+flat arrays and fits every ability and difficulty at once with vectorized Newton
+steps. Counts per (student, question) give the same likelihood as one row per answer,
+so a semester of answers is at most users x questions cells.
+
+The difficulties are saved in the shared CALIBRATION_ID record, which the quizzes use
+to pick questions near each student's ability (see estimate_ability and deck.py).
+
+    python calibrate.py                          # fit and save the difficulties
+    python calibrate.py --abilities out.json     # also write every student's ability
+"""
+import argparse
+import json
+import math
+import sys
+import time
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+from storage import UserStore, open_store
+
+CALIBRATION_ID = "__calibration__"  # reserved id (see storage.is_user_id)
+PRIOR = 1.0  # Gaussian prior (L2) on abilities and difficulties: little data stays near 0
+
+
+def collect(records: Iterable[tuple[str, dict]]):
+    """(uids, qids, user index, question index, answers, correct) arrays from user records."""
+    uids: list[str] = []
+    qid_index: dict[str, int] = {}
+    u: list[int] = []
+    q: list[int] = []
+    n: list[int] = []
+    k: list[int] = []
+    for uid, rec in records:
+        attempts = rec.get("attempts")
+        if not attempts:
+            continue
+        ui = len(uids)
+        uids.append(uid)
+        for qid, (answers, correct) in attempts.items():
+            if answers:
+                u.append(ui)
+                q.append(qid_index.setdefault(qid, len(qid_index)))
+                n.append(answers)
+                k.append(correct)
+    return (uids, list(qid_index), np.array(u, dtype=np.int64), np.array(q, dtype=np.int64),
+            np.array(n, dtype=np.float64), np.array(k, dtype=np.float64))
+
+
+def fit(u: np.ndarray, q: np.ndarray, n: np.ndarray, k: np.ndarray, n_users: int, n_items: int,
+        prior: float = PRIOR, max_iter: int = 100, tol: float = 1e-4) -> tuple[np.ndarray, np.ndarray, int]:
+    """
+    MAP estimates (abilities, difficulties, iterations) by alternating Newton steps:
+    all abilities at once given the difficulties, then all difficulties given the abilities.
+    """
+    theta = np.zeros(n_users)
+    b = np.zeros(n_items)
+    for it in range(1, max_iter + 1):
+        p = 1 / (1 + np.exp(b[q] - theta[u]))
+        step_t = (np.bincount(u, k - n * p, n_users) - prior * theta) / (np.bincount(u, n * p * (1 - p), n_users) + prior)
+        theta += step_t
+        p = 1 / (1 + np.exp(b[q] - theta[u]))
+        step_b = (np.bincount(q, n * p - k, n_items) - prior * b) / (np.bincount(q, n * p * (1 - p), n_items) + prior)
+        b += step_b
+        # the likelihood only sees ability - difficulty, so the common shift is set by the prior
+        # alone; solving it exactly avoids a slow drift of both blocks
+        shift = -(theta.sum() + b.sum()) / (n_users + n_items)
+        theta += shift
+        b += shift
+        if max(np.abs(step_t).max(initial=0), np.abs(step_b).max(initial=0)) < tol:
+            break
+    return theta, b, it
+
+
+def estimate_ability(attempts: dict, difficulty: dict[str, float], prior: float = PRIOR, steps: int = 8) -> float:
+    """
+    One student's ability given the fitted difficulties (same model, questions fixed).
+    Cheap enough for every deck: a few Newton steps over at most one cell per question.
+    """
+    cells = [(difficulty[qid], a, c) for qid, (a, c) in attempts.items() if qid in difficulty and a]
+    theta = 0.0
+    for _ in range(steps):
+        grad, hess = -prior * theta, prior
+        for b, a, c in cells:
+            p = 1 / (1 + math.exp(b - theta))
+            grad += c - a * p
+            hess += a * p * (1 - p)
+        theta += grad / hess
+    return theta
+
+
+def calibrate(store: UserStore) -> tuple[dict, dict[str, float]]:
+    """Fit the whole cohort and save the difficulties. Returns (saved record, abilities)."""
+    t = time.perf_counter()
+    uids, qids, u, q, n, k = collect(store.items())
+    theta, b, iters = fit(u, q, n, k, len(uids), len(qids))
+    rec = {
+        "difficulty": {qid: round(float(x), 4) for qid, x in zip(qids, b)},
+        "students": len(uids),
+        "answers": int(n.sum()),
+        "iterations": iters,
+        "fitted_at": int(time.time()),
+        "seconds": round(time.perf_counter() - t, 3),
+    }
+    store.put(CALIBRATION_ID, rec)
+    return rec, {uid: round(float(x), 4) for uid, x in zip(uids, theta)}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Fit question difficulties and student abilities (Rasch).")
+    parser.add_argument("--db", type=Path, default=Path("data/users.db"))
+    parser.add_argument("--abilities", type=Path, help="write {uid: ability} as JSON here")
+    args = parser.parse_args(argv)
+
+    rec, abilities = calibrate(open_store(args.db))
+    if args.abilities:
+        args.abilities.write_text(json.dumps(abilities, ensure_ascii=False), encoding="utf-8")
+    print(f"{rec['students']} öğrenci, {len(rec['difficulty'])} soru, {rec['answers']} cevap: "
+          f"{rec['iterations']} iterasyon, {rec['seconds']} sn", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
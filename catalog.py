@@ -0,0 +1,140 @@
+"""
+Content packs: the bones and cranial nerve / foramen items the quizzes ask about.
+
+A pack is either a JSON file (`packs/<name>.json` with "bones" and/or "cn_foramina"
+lists, plus optional "aliases": {answer: [other accepted spellings]}) or CSV files
+(`packs/<name>.bones.csv` with name,latin,category,landmarks where landmarks are
+separated by ";", `packs/<name>.cn.csv` with cn,name,foramen and
+`packs/<name>.aliases.csv` with answer,alias).
+All packs in the directory are validated and compiled once into lookup indexes.
+"""
+import csv
+import json
+from pathlib import Path
+
+BONE_FIELDS = ("name", "latin", "category", "landmarks")
+CN_FIELDS = ("cn", "name", "foramen")
+
+
+def bone_item(bone_name: str) -> str:
+    return f"bone:{bone_name}"
+
+
+def cn_item(cn: str) -> str:
+    return f"cn:{cn}"
+
+
+class Catalog:
+    """All loaded items plus the indexes the quiz modes look things up in."""
+
+    def __init__(self, bones: list[dict], cn_foramina: list[dict], aliases: dict[str, list[str]] | None = None):
+        self.bones = bones
+        self.cn_foramina = cn_foramina
+        self.aliases = aliases or {}  # canonical answer -> other accepted spellings
+
+        self.bone_by_name = {b["name"]: b for b in bones}
+        self.bone_index = {b["name"]: i for i, b in enumerate(bones)}
+        self.bone_by_item = {bone_item(b["name"]): b for b in bones}
+        self.bones_by_category: dict[str, list[dict]] = {}
+        self.bones_by_landmark: dict[str, list[dict]] = {}  # lowercased landmark -> bones
+        for b in bones:
+            self.bones_by_category.setdefault(b["category"], []).append(b)
+            for lm in b["landmarks"]:
+                self.bones_by_landmark.setdefault(lm.lower(), []).append(b)
+        self.categories = sorted(self.bones_by_category)
+
+        self.cn_by_item = {cn_item(c["cn"]): c for c in cn_foramina}
+        self.cn_by_label = {f"{c['cn']} ({c['name']})": c for c in cn_foramina}
+        self.foramen_by_nerve = {c["cn"]: c["foramen"] for c in cn_foramina}
+        self.nerves_by_foramen: dict[str, list[dict]] = {}
+        for c in cn_foramina:
+            self.nerves_by_foramen.setdefault(c["foramen"], []).append(c)
+
+
+# -------------------- LOADING --------------------
+def _check(pack: str, kind: str, items, fields: tuple[str, ...]) -> list[dict]:
+    if not isinstance(items, list):
+        raise ValueError(f"pack {pack}: '{kind}' must be a list")
+    for n, it in enumerate(items, 1):
+        if not isinstance(it, dict):
+            raise ValueError(f"pack {pack}: {kind} #{n} is not an object")
+        missing = [f for f in fields if f not in it or (f != "landmarks" and not it[f])]
+        if missing:
+            raise ValueError(f"pack {pack}: {kind} #{n} is missing {', '.join(missing)}")
+        if "landmarks" in fields and not isinstance(it["landmarks"], list):
+            raise ValueError(f"pack {pack}: {kind} #{n} landmarks must be a list")
+    return items
+
+
+def _read_csv(pack: str, path: Path) -> list[dict]:
+    rows = []
+    with path.open(encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            # DictReader puts extra cells under None and fills missing ones with None
+            if None in row or None in row.values():
+                raise ValueError(f"pack {pack}: line {reader.line_num} has {'more' if None in row else 'fewer'} "
+                                 f"columns than the header")
+            rows.append({k.strip(): v.strip() for k, v in row.items()})
+    return rows
+
+
+def _check_aliases(pack: str, aliases) -> dict[str, list[str]]:
+    if not isinstance(aliases, dict) or not all(
+        isinstance(v, list) and all(isinstance(x, str) for x in v) for v in aliases.values()
+    ):
+        raise ValueError(f"pack {pack}: 'aliases' must map answers to lists of strings")
+    return aliases
+
+
+def read_pack(path: Path) -> tuple[list[dict], list[dict], dict[str, list[str]]]:
+    """(bones, cn_foramina, aliases) of one pack file, validated."""
+    path = Path(path)
+    pack = path.name
+    if path.suffix == ".json":
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except ValueError as e:
+            raise ValueError(f"pack {pack}: invalid JSON ({e})") from None
+        if not isinstance(data, dict):
+            raise ValueError(f"pack {pack}: the top level must be an object")
+        return (_check(pack, "bones", data.get("bones", []), BONE_FIELDS),
+                _check(pack, "cn_foramina", data.get("cn_foramina", []), CN_FIELDS),
+                _check_aliases(pack, data.get("aliases", {})))
+    if path.name.endswith(".bones.csv"):
+        rows = _read_csv(pack, path)
+        for r in rows:
+            r["landmarks"] = [x.strip() for x in r.get("landmarks", "").split(";") if x.strip()]
+        return _check(pack, "bones", rows, BONE_FIELDS), [], {}
+    if path.name.endswith(".cn.csv"):
+        return [], _check(pack, "cn_foramina", _read_csv(pack, path), CN_FIELDS), {}
+    if path.name.endswith(".aliases.csv"):
+        aliases: dict[str, list[str]] = {}
+        for r in _read_csv(pack, path):
+            if not r.get("answer") or not r.get("alias"):
+                raise ValueError(f"pack {pack}: every row needs answer and alias")
+            aliases.setdefault(r["answer"], []).append(r["alias"])
+        return [], [], aliases
+    raise ValueError(f"pack {pack}: unknown format")
+
+
+def load_catalog(pack_dir: Path) -> Catalog:
+    bones: list[dict] = []
+    cn_foramina: list[dict] = []
+    aliases: dict[str, list[str]] = {}
+    paths = sorted(Path(pack_dir).glob("*.json")) + sorted(Path(pack_dir).glob("*.csv"))
+    if not paths:
+        raise ValueError(f"no content packs in {pack_dir}")
+    for path in paths:
+        b, c, al = read_pack(path)
+        bones += b
+        cn_foramina += c
+        for answer, forms in al.items():
+            aliases.setdefault(answer, []).extend(forms)
+    for kind, items, key in (("bone", bones, "name"), ("cn", cn_foramina, "cn")):
+        seen = set()
+        for it in items:
+            if it[key] in seen:
+                raise ValueError(f"duplicate {kind} '{it[key]}' across packs")
+            seen.add(it[key])
+    return Catalog(bones, cn_foramina, aliases)
@@ -0,0 +1,35 @@
+"""
+Deployment settings and static page assets, evaluated once per process on first import.
+"""
+import os
+import re
+from pathlib import Path
+
+DATA_DIR = Path("data")
+USERS_DB = DATA_DIR / "users.db"  # user-specific storage (SQLite, one row per user)
+LEGACY_USERS_JSON = DATA_DIR / "users.json"  # old single-file storage, migrated on first start
+USER_CACHE_MAX_BYTES = 32 * 1024 * 1024  # shared in-process user-record cache (LRU)
+JOURNAL_DIR = DATA_DIR / "journal"  # append-only answer events, folded into users.db every few seconds
+WRONGS_KEEP = 200  # raw wrong answers kept per user; older ones are rolled up into counters
+ADMIN_PASSWORD = os.environ.get("SKULL_ADMIN_PASSWORD", "")  # enables the instructor tools in the sidebar
+METRICS_DIR = os.environ.get("SKULL_METRICS_DIR", "")  # if set, Prometheus .prom files are written here
+
+PACKS_DIR = Path(__file__).with_name("packs")  # shipped with the code, not per-deployment data
+ASSETS_DIR = Path("assets/bones")
+ASSET_CACHE_DIR = Path("assets/.cache/bones")  # resized WebP variants, built at startup
+IMAGE_CACHE_MAX_BYTES = 16 * 1024 * 1024
+MOBILE_IMAGE_WIDTH = 640
+DESKTOP_IMAGE_WIDTH = 960
+
+BASE_URL = "https://skull-trainer-nehir.streamlit.app"
+
+
+def _minify_css(css: str) -> str:
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};:,])\s*", r"\1", css).strip()
+
+
+# theme.css is sent with every full rerun (Streamlit drops elements a run doesn't emit),
+# so it is read and minified once here instead of per rerun
+MOBILE_CSS = f"<style>{_minify_css(Path(__file__).with_name('theme.css').read_text(encoding='utf-8'))}</style>"
@@ -0,0 +1,62 @@
+import math
+import random
+from dataclasses import dataclass
+
+from catalog import Catalog, bone_item, cn_item
+from metrics import timed
+from srs import build_queue, pop_next, push
+
+BONE_MODES = ("latin", "category", "landmark")
+CN_STYLES = ("cn_to_foramen", "foramen_to_cn")
+MIN_TARGET_WEIGHT = 0.05  # questions far from the student's level still come up now and then
+
+
+@dataclass(slots=True, frozen=True)
+class Question:
+    """One question of a deck: catalog indices only; the text is rendered when shown."""
+    kind: str  # "bone" | "cn"
+    idx: int  # position in catalog.bones / catalog.cn_foramina
+    mode: str  # one of BONE_MODES / CN_STYLES
+    example: int = 0  # which landmark the prompt shows as an example
+
+
+def item_id(catalog: Catalog, kind: str, idx: int) -> str:
+    if kind == "bone":
+        return bone_item(catalog.bones[idx]["name"])
+    return cn_item(catalog.cn_foramina[idx]["cn"])
+
+
+def target_weight(difficulty: float | None, ability: float) -> float:
+    """Highest for questions the student gets right about half the time; uncalibrated ones count as on target."""
+    if difficulty is None:
+        return 1.0
+    return max(MIN_TARGET_WEIGHT, math.exp(-0.5 * (difficulty - ability) ** 2))
+
+
+@timed("skull_deck_generate_seconds")
+def generate_deck(catalog: Catalog, kind: str, pool: list[int], total: int, seed: int,
+                  states: dict | None = None, weights: dict | None = None,
+                  difficulty: dict[str, float] | None = None, ability: float = 0.0) -> list[Question]:
+    """
+    Build the whole deck up front. The same seed, pool and SRS states give the same deck.
+    Items come in SRS queue order; once each has been used, they repeat in a new order.
+    With calibrated `difficulty` (qid -> difficulty, see calibrate.py), items and modes
+    near the student's `ability` are preferred.
+    """
+    rng = random.Random(seed)
+    modes = BONE_MODES if kind == "bone" else CN_STYLES
+    index = {item_id(catalog, kind, i): i for i in pool}
+    mode_weights = None
+    if difficulty:
+        mode_weights = {item: [target_weight(difficulty.get(f"{item}:{m}"), ability) for m in modes] for item in index}
+        weights = {item: (weights or {}).get(item, 1) * max(mw) for item, mw in mode_weights.items()}
+    queue = build_queue(list(index), states or {}, weights, rng)
+    deck = []
+    for _ in range(total):
+        item = pop_next(queue)
+        push(queue, item, math.inf, rng)
+        idx = index[item]
+        n_examples = len(catalog.bones[idx]["landmarks"]) if kind == "bone" else 0
+        mode = rng.choices(modes, mode_weights[item])[0] if mode_weights else rng.choice(modes)
+        deck.append(Question(kind, idx, mode, rng.randrange(n_examples) if n_examples else 0))
+    return deck
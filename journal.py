@@ -0,0 +1,311 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+import zlib
+from pathlib import Path
+from typing import Callable
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so every other journal dir is treated as orphaned
+    fcntl = None
+
+from activity import day_of, mark_day
+from analytics import count_week
+from config import WRONGS_KEEP
+from metrics import inc, timed
+from srs import review
+from storage import UserStore, new_record
+
+
+log = logging.getLogger("skull_trainer")
+
+FOLDED_KEEP = 8  # journal tokens remembered per record in rec["folded"]
+
+
+# -------------------- EVENTS --------------------
+def trim_wrongs(rec: dict, keep: int = WRONGS_KEEP) -> bool:
+    """
+    Keep only the newest `keep` raw wrongs; fold the older ones into
+    rec["wrong_archive"] (counts per item and per mode). True if anything moved.
+    """
+    wrongs = rec.get("wrongs", [])
+    extra = len(wrongs) - keep
+    if extra <= 0:
+        return False
+    archive = rec.setdefault("wrong_archive", {"count": 0, "first_ts": None, "last_ts": None, "items": {}, "modes": {}})
+    for w in wrongs[:extra]:
+        archive["count"] += 1
+        ts = w.get("ts")
+        if ts is not None:
+            archive["first_ts"] = ts if archive["first_ts"] is None else min(archive["first_ts"], ts)
+            archive["last_ts"] = ts if archive["last_ts"] is None else max(archive["last_ts"], ts)
+        if w.get("qid"):
+            item, mode = w["qid"].rsplit(":", 1)
+            archive["items"][item] = archive["items"].get(item, 0) + 1
+            archive["modes"][mode] = archive["modes"].get(mode, 0) + 1
+    rec["wrongs"] = wrongs[extra:]
+    return True
+
+
+def apply_event(rec: dict, ev: dict, wrongs_keep: int = WRONGS_KEEP) -> None:
+    """Fold one journal event into a user record (the snapshot)."""
+    t = ev["t"]
+    if t == "stats":
+        rec["stats"]["correct"] += int(ev["correct"])
+        rec["stats"]["total"] += int(ev["total"])
+    elif t == "wrong":
+        qid = ev.get("qid")
+        rec["wrongs"].append({"q": ev["q"], "user": ev["user"], "correct": ev["correct"], "ts": ev["ts"], "qid": qid,
+                            "tab": ev.get("tab")})
+        if qid:
+            misses = rec.setdefault("misses", {})
+            misses[qid] = misses.get(qid, 0) + 1
+        trim_wrongs(rec, wrongs_keep)
+    elif t == "clear_wrongs":
+        rec["wrongs"] = []
+        rec["misses"] = {}
+        rec.pop("wrong_archive", None)
+    elif t == "reset_stats":
+        rec["stats"] = {"correct": 0, "total": 0}
+    elif t == "review":
+        srs = rec.setdefault("srs", {})
+        srs[ev["item"]] = review(srs.get(ev["item"]), ev["ok"], ev["ts"])
+        count_week(rec, ev["ts"], ev["ok"])
+        mark_day(rec, day_of(ev["ts"]))
+        if ev.get("qid"):
+            # answers / correct per question, the input of the difficulty calibration (calibrate.py)
+            a = rec.setdefault("attempts", {}).setdefault(ev["qid"], [0, 0])
+            a[0] += 1
+            a[1] += int(ev["ok"])
+    elif t == "replace":
+        rec.clear()
+        rec.update(copy.deepcopy(ev["data"]))
+        trim_wrongs(rec, wrongs_keep)
+
+
+def _folder(events: list[dict], wrongs_keep: int = WRONGS_KEEP) -> Callable[[dict], None]:
+    def fold(rec: dict) -> None:
+        for ev in events:
+            apply_event(rec, ev, wrongs_keep)
+    return fold
+
+
+def _mark_folded(fold: Callable[[dict], None], token: str, gen: int) -> Callable[[dict], None]:
+    """Record in the user record itself which journal generation it already contains."""
+    def run(rec: dict) -> None:
+        fold(rec)
+        folded = rec.setdefault("folded", {})
+        folded.pop(token, None)
+        folded[token] = gen
+        for old in list(folded)[:-FOLDED_KEEP]:  # oldest processes first
+            del folded[old]
+    return run
+
+
+# -------------------- JOURNAL --------------------
+class AnswerJournal:
+    """
+    Append-only NDJSON journal in front of a UserStore.
+
+    Each process writes to its own directory under `root`, split into shards by user ID.
+    Appends only write one line (fsync'd in batches by a flusher thread). A compactor
+    thread periodically seals the shard files and folds their events into the store in
+    one transaction per file, so the store always holds the latest snapshot and only
+    the tail since the last compaction lives in the journal. Reads go through `view()`,
+    which applies this process's not-yet-compacted events on top of the snapshot. Each
+    fold also stores its journal generation in the record (rec["folded"]), so `view()`
+    skips events that are already in the snapshot without locking out folds.
+
+    On startup, journals left behind by processes that are gone (their flock is free)
+    are replayed into the store.
+    """
+
+    def __init__(self, root: Path, store: UserStore, shards: int = 8,
+                 fsync_interval: float = 0.2, compact_interval: float = 2.0, wrongs_keep: int = WRONGS_KEEP,
+                 aggregate: Callable[[dict, dict], dict] | None = None):
+        self.root = Path(root).absolute()  # atexit close() may run after the cwd changed
+        self.store = store
+        self.shards = shards
+        self.wrongs_keep = wrongs_keep
+        self.aggregate = aggregate  # (events by uid, per-user folds) -> folds to apply, e.g. analytics.with_cohort
+        self.token = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        # the directory is locked under a hidden name and only then renamed into place, so
+        # another process's recover() never sees it unlocked and replays/removes it
+        starting = self.root / f".{self.token}"
+        starting.mkdir(parents=True)
+        self._owner = open(starting / "owner.lock", "w")
+        if fcntl is not None:
+            fcntl.flock(self._owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.dir = self.root / self.token
+        starting.rename(self.dir)
+
+        self._gen = 0
+        self._files: list = [None] * shards
+        self._shard_locks = [threading.Lock() for _ in range(shards)]
+        self._dirty: set[int] = set()
+        self._pending: dict[str, list[tuple[int, dict]]] = {}  # uid -> [(gen, event)], not compacted yet
+        self._pending_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+
+        self.recover()
+        atexit.register(self.close)
+        for target, interval in ((self._fsync_loop, fsync_interval), (self._compact_loop, compact_interval)):
+            threading.Thread(target=target, args=(interval,), daemon=True).start()
+
+    def _shard(self, uid: str) -> int:
+        return zlib.crc32(uid.encode("utf-8")) % self.shards
+
+    # ---- write path ----
+    def append(self, uid: str, ev: dict) -> None:
+        self.append_many(uid, [ev])
+
+    @timed("skull_journal_append_seconds")
+    def append_many(self, uid: str, events: list[dict]) -> None:
+        """Append several events of one user with a single write."""
+        shard = self._shard(uid)
+        lines = "".join(json.dumps({"uid": uid, **ev}, ensure_ascii=False) + "\n" for ev in events)
+        with self._shard_locks[shard]:
+            f = self._files[shard]
+            if f is None:
+                f = self._files[shard] = open(self.dir / f"{shard:02d}.{self._gen}.ndjson", "a", encoding="utf-8")
+            f.write(lines)
+            f.flush()  # in the OS page cache now; survives a process crash
+            self._dirty.add(shard)
+            with self._pending_lock:
+                self._pending.setdefault(uid, []).extend((self._gen, ev) for ev in events)
+        inc("skull_journal_events_total", len(events))
+
+    def _fsync_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                self.fsync()
+            except Exception:  # keep the thread alive; the next round retries
+                log.exception("journal fsync failed")
+
+    def fsync(self) -> None:
+        for shard in list(self._dirty):
+            with self._shard_locks[shard]:
+                f = self._files[shard]
+                if f is not None:
+                    os.fsync(f.fileno())
+                self._dirty.discard(shard)
+
+    # ---- read path ----
+    def view(self, uid: str) -> dict:
+        """The user's record including answers that are still only in the journal."""
+        # pending first, then the store: a fold that commits in between is recognised by its
+        # generation in rec["folded"], so no lock is held across the store read
+        with self._pending_lock:
+            pending = list(self._pending.get(uid, ()))
+        rec = self.store.get(uid)
+        done = rec.get("folded", {}).get(self.token, -1) if rec is not None else -1
+        events = [ev for gen, ev in pending if gen > done]
+        if not events:
+            return rec if rec is not None else new_record()
+        rec = copy.deepcopy(rec) if rec is not None else new_record()
+        _folder(events, self.wrongs_keep)(rec)
+        return rec
+
+    # ---- compaction ----
+    def _seal(self) -> None:
+        for lock in self._shard_locks:
+            lock.acquire()
+        try:
+            for shard, f in enumerate(self._files):
+                if f is None:
+                    continue
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+                path = Path(f.name)
+                path.rename(path.with_suffix(".sealed"))
+                self._files[shard] = None
+            self._dirty.clear()
+            self._gen += 1
+        finally:
+            for lock in self._shard_locks:
+                lock.release()
+
+    @timed("skull_journal_fold_seconds")
+    def _fold_file(self, path: Path, forget_pending: bool) -> None:
+        gen = int(path.name.split(".")[1])
+        marker = f"{path.parent.name}/{path.stem}"
+        by_uid: dict[str, list[dict]] = {}
+        with path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    ev = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from a crash
+                by_uid.setdefault(ev.pop("uid"), []).append(ev)
+        if by_uid:
+            # no journal lock across the write: it may wait for another process's SQLite lock
+            fns = {uid: _mark_folded(_folder(evs, self.wrongs_keep), path.parent.name, gen)
+                   for uid, evs in by_uid.items()}
+            if self.aggregate is not None:
+                fns = self.aggregate(by_uid, fns)
+            self.store.update_many(fns, marker=marker)
+        if forget_pending:
+            with self._pending_lock:
+                for uid in by_uid:
+                    left = [p for p in self._pending.get(uid, ()) if p[0] > gen]
+                    if left:
+                        self._pending[uid] = left
+                    else:
+                        self._pending.pop(uid, None)
+        path.unlink()
+        self.store.drop_marker(marker)
+
+    @staticmethod
+    def _journal_files(d: Path, pattern: str) -> list[Path]:
+        return sorted(d.glob(pattern), key=lambda p: int(p.name.split(".")[1]))
+
+    def compact(self) -> None:
+        with self._compact_lock:
+            self._seal()
+            for path in self._journal_files(self.dir, "*.sealed"):
+                self._fold_file(path, forget_pending=True)
+
+    def _compact_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            if self._pending:
+                try:
+                    self.compact()
+                except Exception:  # e.g. "database is locked"; sealed files are folded next round
+                    log.exception("journal compaction failed")
+
+    def recover(self) -> None:
+        """Replay journals of processes that exited before compacting them."""
+        for d in sorted(self.root.iterdir()):
+            if d == self.dir or not d.is_dir() or d.name.startswith("."):
+                continue  # hidden: a process that is still starting up (see __init__)
+            lock_path = d / "owner.lock"
+            if fcntl is not None and lock_path.exists():
+                with open(lock_path, "a") as lf:
+                    try:
+                        fcntl.flock(lf, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue  # owner is still running
+                    self._replay_dir(d)
+            else:
+                self._replay_dir(d)
+            shutil.rmtree(d, ignore_errors=True)
+
+    def _replay_dir(self, d: Path) -> None:
+        for path in self._journal_files(d, "*.ndjson"):
+            path.rename(path.with_suffix(".sealed"))
+        for path in self._journal_files(d, "*.sealed"):
+            self._fold_file(path, forget_pending=False)
+
+    def close(self) -> None:
+        self.compact()
@@ -0,0 +1,133 @@
+"""
+Answer matching, compiled once per catalog.
+
+Every accepted answer (Latin names, categories, landmarks, foramina, cranial nerves)
+is registered under its normalized spellings and aliases. Checking an answer is a dict
+lookup, falling back to a BK-tree search for small typos.
+"""
+import re
+import unicodedata
+from typing import Iterable
+
+from catalog import Catalog
+
+ROMAN = {"i": 1, "ii": 2, "iii": 3, "iv": 4, "v": 5, "vi": 6, "vii": 7, "viii": 8, "ix": 9, "x": 10, "xi": 11, "xii": 12}
+
+
+def normalize(s: str) -> str:
+    """Casefold (Turkish dotted/dotless i included), strip diacritics and punctuation."""
+    s = s.replace("İ", "i").replace("I", "i").replace("ı", "i").casefold()
+    s = "".join(ch for ch in unicodedata.normalize("NFKD", s) if not unicodedata.combining(ch))
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", s).split())
+
+
+def edit_distance(a: str, b: str) -> int:
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def typo_budget(n: str) -> int:
+    # short answers ("x", "cn ix") must match exactly, otherwise "xi" would pass for "x"
+    if len(n) <= 5:
+        return 0
+    return 1 if len(n) <= 10 else 2
+
+
+class BKTree:
+    """Burkhard-Keller tree over edit distance: finds all words within d of a query."""
+
+    def __init__(self):
+        self.root: tuple[str, dict] | None = None
+
+    def add(self, word: str) -> None:
+        if self.root is None:
+            self.root = (word, {})
+            return
+        node = self.root
+        while True:
+            d = edit_distance(word, node[0])
+            if d == 0:
+                return
+            child = node[1].get(d)
+            if child is None:
+                node[1][d] = (word, {})
+                return
+            node = child
+
+    def search(self, word: str, max_dist: int) -> list[tuple[int, str]]:
+        out = []
+        stack = [self.root] if self.root else []
+        while stack:
+            w, children = stack.pop()
+            d = edit_distance(word, w)
+            if d <= max_dist:
+                out.append((d, w))
+            for k in range(d - max_dist, d + max_dist + 1):
+                if k in children:
+                    stack.append(children[k])
+        return out
+
+
+def _strip_paren(s: str) -> str:
+    return re.sub(r"\s*\(.*?\)", "", s).strip()
+
+
+def _nerve_forms(cn: dict) -> list[str]:
+    code = _strip_paren(cn["cn"])  # "CN VII (exit)" -> "CN VII"
+    forms = [cn["cn"], f"{cn['cn']} ({cn['name']})", cn["name"], _strip_paren(cn["name"]), code]
+    m = re.fullmatch(r"CN\s+([IVX]+)(\d*)", code)
+    if m:
+        roman, sub = m.group(1).lower(), m.group(2)
+        arabic = ROMAN.get(roman)
+        forms += [f"{roman}{sub}", f"cn{roman}{sub}"]
+        if arabic and sub:
+            # "cn 5 1"; never "51", which reads as a different number
+            forms += [f"cn {arabic} {sub}"]
+        elif arabic:
+            forms += [f"cn {arabic}", str(arabic)]
+    return forms
+
+
+class Matcher:
+    def __init__(self, catalog: Catalog):
+        self._canon: dict[str, set[str]] = {}  # normalized form -> canonical answers
+        self._tree = BKTree()
+        aliases = catalog.aliases
+        for b in catalog.bones:
+            for answer in (b["latin"], b["category"], *b["landmarks"]):
+                self._register(answer, [answer, *aliases.get(answer, ())])
+        for c in catalog.cn_foramina:
+            self._register(c["foramen"], [c["foramen"], *aliases.get(c["foramen"], ())])
+            self._register(c["cn"], _nerve_forms(c) + list(aliases.get(c["cn"], ())))
+
+    def _register(self, canonical: str, forms: Iterable[str]) -> None:
+        for f in forms:
+            n = normalize(f)
+            if n:
+                self._canon.setdefault(n, set()).add(canonical)
+                self._tree.add(n)
+
+    def resolve(self, user: str) -> set[str]:
+        """Canonical answers the input stands for (closest ones if it's a typo)."""
+        n = normalize(user)
+        if not n:
+            return set()
+        hit = self._canon.get(n)
+        if hit is not None:
+            return hit
+        budget = typo_budget(n)
+        if not budget:
+            return set()
+        near = self._tree.search(n, budget)
+        if not near:
+            return set()
+        best = min(d for d, _ in near)
+        return set().union(*(self._canon[w] for d, w in near if d == best))
+
+    def accepts(self, user: str, accepted: Iterable[str]) -> bool:
+        return not self.resolve(user).isdisjoint(accepted)
@@ -0,0 +1,202 @@
+"""
+In-process metrics: counters and latency histograms around the hot paths (storage,
+journal, answer checks, deck building, images, reruns), aggregated per process.
+
+Read them in the instructor metrics view, or let `TextfileExporter` write them in
+Prometheus text format for a local scraper (node_exporter's textfile collector, or
+anything that can read a .prom file).
+"""
+import bisect
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import ContextDecorator
+from pathlib import Path
+
+log = logging.getLogger("skull_trainer")
+
+# seconds; the last bucket is +Inf
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+HELP = {
+    "skull_storage_load_seconds": "Reading and parsing one user record from the backend.",
+    "skull_storage_save_seconds": "Serializing and writing one user record to the backend.",
+    "skull_storage_read_bytes_total": "Bytes of user records read from the backend.",
+    "skull_storage_written_bytes_total": "Bytes of user records written to the backend.",
+    "skull_storage_conflicts_total": "Compare-and-swap writes that lost to another writer and were retried.",
+    "skull_journal_append_seconds": "Appending events to the answer journal.",
+    "skull_journal_fold_seconds": "Folding one sealed journal file into the store.",
+    "skull_journal_events_total": "Events appended to the answer journal.",
+    "skull_wrong_weights_seconds": "Computing per-item weights from the miss counters.",
+    "skull_deck_generate_seconds": "Generating a quiz deck.",
+    "skull_answer_check_seconds": "Checking one answer with the matcher.",
+    "skull_image_load_seconds": "Getting the bytes of one bone image.",
+    "skull_image_bytes_total": "Bytes of bone images served.",
+    "skull_image_cache_total": "Bone image lookups by in-memory cache result.",
+    "skull_prefetch_total": "Quiz questions taken from the lookahead (hit, wait) or built inline (miss).",
+    "skull_script_run_seconds": "Full script runs (cold = first run of the process).",
+    "skull_section_seconds": "Time spent rendering one part of the page in a run.",
+}
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1  # bucket i holds values <= buckets[i]
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the q-quantile (None if empty)."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, n in zip((*self.buckets, float("inf")), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def since(self, earlier: "Histogram | None") -> "Histogram":
+        """Observations made after `earlier` (a copy of this histogram taken before)."""
+        out = Histogram(self.buckets)
+        out.counts = [a - b for a, b in zip(self.counts, earlier.counts)] if earlier else list(self.counts)
+        out.sum = self.sum - (earlier.sum if earlier else 0.0)
+        out.count = self.count - (earlier.count if earlier else 0)
+        return out
+
+
+class _Timer(ContextDecorator):
+    def __init__(self, metrics: "Metrics", name: str, labels: dict):
+        self.metrics, self.name, self.labels = metrics, name, labels
+
+    def _recreate_cm(self):
+        return _Timer(self.metrics, self.name, self.labels)  # one timer per call: decorated functions run concurrently
+
+    def __enter__(self):
+        self._t = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self._t, **self.labels)
+        return False
+
+
+class Metrics:
+    def __init__(self):
+        self._hists: dict[tuple[str, tuple], Histogram] = {}
+        self._counters: dict[tuple[str, tuple], float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._hists.get(key)
+            if h is None:
+                h = self._hists[key] = Histogram()
+            h.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def timed(self, name: str, **labels) -> _Timer:
+        """Context manager / decorator observing the elapsed seconds into `name`."""
+        return _Timer(self, name, labels)
+
+    def histograms(self, name: str) -> dict[tuple, Histogram]:
+        """Copies of every histogram of `name`, keyed by labels (diff two of them with `since`)."""
+        with self._lock:
+            return {labels: h.since(None) for (n, labels), h in self._hists.items() if n == name}
+
+    def snapshot(self) -> tuple[list[dict], list[dict]]:
+        """(histograms, counters) as rows for the metrics view."""
+        with self._lock:
+            hists = [{"metric": name, "labels": dict(labels), "count": h.count,
+                      "mean_ms": round(h.sum / h.count * 1000, 3) if h.count else None,
+                      "p50_ms": _ms(h.quantile(0.5)), "p95_ms": _ms(h.quantile(0.95)), "p99_ms": _ms(h.quantile(0.99))}
+                     for (name, labels), h in sorted(self._hists.items())]
+            counters = [{"metric": name, "labels": dict(labels), "value": v}
+                        for (name, labels), v in sorted(self._counters.items())]
+        return hists, counters
+
+    def prometheus(self, **const_labels) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        out: list[str] = []
+        typed: set[str] = set()
+
+        def header(name: str, kind: str) -> None:
+            if name not in typed:
+                typed.add(name)
+                if name in HELP:
+                    out.append(f"# HELP {name} {HELP[name]}")
+                out.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (name, labels), h in sorted(self._hists.items()):
+                header(name, "histogram")
+                base = {**const_labels, **dict(labels)}
+                cum = 0
+                for bound, n in zip((*h.buckets, float("inf")), h.counts):
+                    cum += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    out.append(f"{name}_bucket{_labels({**base, 'le': le})} {cum}")
+                out.append(f"{name}_sum{_labels(base)} {h.sum!r}")
+                out.append(f"{name}_count{_labels(base)} {h.count}")
+            for (name, labels), v in sorted(self._counters.items()):
+                header(name, "counter")
+                out.append(f"{name}{_labels({**const_labels, **dict(labels)})} {v!r}")
+        return "\n".join(out) + "\n"
+
+
+def _ms(seconds: float | None) -> float | None:
+    if seconds is None or seconds == float("inf"):
+        return seconds
+    return round(seconds * 1000, 3)
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels.items()) + "}"
+
+
+class TextfileExporter:
+    """Rewrites `<dir>/skull_trainer_<host>-<pid>.prom` every `interval` seconds (atomically)."""
+
+    def __init__(self, metrics: "Metrics", out_dir: Path, interval: float = 15.0):
+        self.metrics = metrics
+        # not "instance": Prometheus sets that itself and renames a scraped one to exported_instance
+        self.replica = f"{socket.gethostname()}-{os.getpid()}"
+        self.path = Path(out_dir) / f"skull_trainer_{self.replica}.prom"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.interval = interval
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def write(self) -> None:
+        tmp = self.path.with_suffix(".prom.tmp")
+        tmp.write_text(self.metrics.prometheus(replica=self.replica), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except Exception:  # e.g. disk full or the directory removed; retried next interval
+                log.exception("metrics export failed")
+
+
+METRICS = Metrics()  # the process-wide registry every module records into
+observe = METRICS.observe
+inc = METRICS.inc
+timed = METRICS.timed
@@ -0,0 +1,64 @@
+"""
+Lookahead for quiz rounds: while a question is on screen, the next ones (text,
+answer and image bytes) are prepared on a shared thread pool. The rerun after an
+answer takes the finished result instead of building it inline.
+
+Loaders run off the script thread, so they must not touch Streamlit APIs; anything
+that depends on the session (e.g. the image width for this device) is bound before
+scheduling.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Generic, Sequence, TypeVar
+
+from metrics import inc
+
+T = TypeVar("T")
+Q = TypeVar("Q")
+
+AHEAD = 2
+
+
+class Prefetcher(Generic[Q, T]):
+    """Per-round lookahead over a fixed deck; keeps at most `ahead` futures."""
+
+    def __init__(self, pool: ThreadPoolExecutor, deck: Sequence[Q], load: Callable[[Q], T], ahead: int = AHEAD):
+        self.pool = pool
+        self.deck = deck
+        self.load = load
+        self.ahead = ahead
+        self._futures: dict[int, Future] = {}
+        self._current: tuple[int, T] | None = None  # fragment reruns of the same question reuse it
+        self.schedule(-1)  # the first questions start loading with the round
+
+    def get(self, i: int) -> T:
+        """The prepared item `i` (or built now if it wasn't scheduled), then schedule the next ones."""
+        if self._current is not None and self._current[0] == i:
+            return self._current[1]
+        fut = self._futures.pop(i, None)
+        if fut is not None and not fut.cancel():  # already running or finished: use it
+            result = "hit" if fut.done() else "wait"
+            try:
+                value = fut.result()
+            except Exception:
+                fut = None
+        else:
+            fut = None
+        if fut is None:
+            result = "miss"
+            value = self.load(self.deck[i])
+        inc("skull_prefetch_total", result=result)
+        self._current = (i, value)
+        self.schedule(i)
+        return value
+
+    def schedule(self, i: int) -> None:
+        for j in [j for j in self._futures if j <= i]:
+            self._futures.pop(j).cancel()
+        for j in range(i + 1, min(i + 1 + self.ahead, len(self.deck))):
+            if j not in self._futures:
+                self._futures[j] = self.pool.submit(self.load, self.deck[j])
+
+    def close(self) -> None:
+        for fut in self._futures.values():
+            fut.cancel()
+        self._futures.clear()
@@ -0,0 +1,124 @@
+"""
+Question text, answer checking and stable question ids for the quiz modes.
+
+Every question carries an id (item + mode, e.g. "bone:Frontal:latin"); wrong answers
+are counted per id. Everything here is a pure function of the catalog/matcher, so it
+lives outside the Streamlit script and is not redefined on every rerun.
+"""
+import re
+
+from catalog import Catalog, bone_item, cn_item
+from deck import Question, item_id
+from matching import Matcher
+from metrics import timed
+
+
+def bone_qid(bone_name: str, mode: str) -> str:
+    return f"{bone_item(bone_name)}:{mode}"
+
+
+def cn_qid(cn: str, style: str) -> str:
+    return f"{cn_item(cn)}:{style}"
+
+
+def question_item(catalog: Catalog, q: Question) -> str:
+    return item_id(catalog, q.kind, q.idx)
+
+
+def question_id(catalog: Catalog, q: Question) -> str:
+    return f"{question_item(catalog, q)}:{q.mode}"
+
+
+def item_keywords(catalog: Catalog, item: str) -> str:
+    """Review araması için bir öğenin ek kelimeleri (Latin adı, kategori, foramen...)."""
+    b = catalog.bone_by_item.get(item)
+    if b:
+        return " ".join((b["name"], b["latin"], b["category"], *b.get("landmarks", [])))
+    c = catalog.cn_by_item.get(item)
+    if c:
+        return " ".join((c["cn"], c["name"], c["foramen"]))
+    return ""
+
+
+def question_id_for_wrong(catalog: Catalog, w: dict) -> str | None:
+    """Eski (qid'siz) bir yanlışın soru metninden qid'sini çıkar."""
+    q = w.get("q", "")
+    m = re.match(r"\*\*(.+?)\*\*", q)
+    if not m:
+        return None
+    head = m.group(1)
+    if "hangi yapıdan geçer" in q:
+        cn = catalog.cn_by_label.get(head)
+        return cn_qid(cn["cn"], "cn_to_foramen") if cn else None
+    if "içinden geçen sinir" in q:
+        cn = catalog.cn_by_label.get(w.get("correct", ""))
+        return cn_qid(cn["cn"], "foramen_to_cn") if cn else None
+    for mode, marker in (("latin", "Latin adı"), ("category", "hangi kategori"), ("landmark", "landmark yaz")):
+        if marker in q:
+            return bone_qid(head, mode)
+    return None
+
+
+def backfill_question_ids(catalog: Catalog, rec: dict) -> bool:
+    """qid'siz yanlışları etiketle, misses sayacını kur. Kayıt değiştiyse True."""
+    rebuild = changed = "misses" not in rec  # sayaç yoksa tüm yanlışlardan kurulur
+    misses = rec.setdefault("misses", {})
+    for w in rec.get("wrongs", []):
+        tagged = "qid" not in w
+        if tagged:
+            w["qid"] = question_id_for_wrong(catalog, w)
+            changed = True
+        # zaten qid'li yanlışlar sayaçta var: sadece yeni etiketlenenler eklenir
+        if (rebuild or tagged) and w["qid"]:
+            misses[w["qid"]] = misses.get(w["qid"], 0) + 1
+    return changed
+
+
+@timed("skull_wrong_weights_seconds")
+def miss_weights(misses: dict, items: list[str], modes: tuple[str, ...]) -> dict:
+    """
+    Item'ın herhangi bir modunda yapılan her yanlış, ağırlığını +3 artırır (misses sayacından).
+    """
+    return {item: 1 + 3 * sum(misses.get(f"{item}:{mode}", 0) for mode in modes) for item in items}
+
+
+# -------------------- RENDER / CHECK --------------------
+def make_bone_question(catalog: Catalog, bone: dict, mode: str, example: int = 0) -> tuple[str, str]:
+    if mode == "latin":
+        return f"**{bone['name']}** kemiğinin Latin adı nedir?", bone["latin"]
+    if mode == "category":
+        return f"**{bone['name']}** hangi kategori? ({' / '.join(catalog.categories)})", bone["category"]
+    ex = bone["landmarks"][example] if bone["landmarks"] else ""
+    return f"**{bone['name']}** ile ilişkili landmark yaz (örn: {ex})", " / ".join(bone["landmarks"])
+
+
+def make_cn_question(item: dict, style: str) -> tuple[str, str]:
+    if style == "cn_to_foramen":
+        return f"**{item['cn']} ({item['name']})** hangi yapıdan geçer?", item["foramen"]
+    return f"**{item['foramen']}** içinden geçen sinir hangisi?", f"{item['cn']} ({item['name']})"
+
+
+def render_question(catalog: Catalog, q: Question) -> tuple[str, str]:
+    if q.kind == "bone":
+        return make_bone_question(catalog, catalog.bones[q.idx], q.mode, q.example)
+    return make_cn_question(catalog.cn_foramina[q.idx], q.mode)
+
+
+@timed("skull_answer_check_seconds", kind="bone")
+def check_bone_answer(matcher: Matcher, mode: str, bone: dict, user: str) -> bool:
+    if mode == "landmark":
+        accepted = bone["landmarks"]
+    else:
+        accepted = (bone["latin"] if mode == "latin" else bone["category"],)
+    return matcher.accepts(user, accepted)
+
+
+@timed("skull_answer_check_seconds", kind="cn")
+def check_cn_answer(catalog: Catalog, matcher: Matcher, style: str, user: str, correct: str) -> bool:
+    if style == "foramen_to_cn":
+        # aynı foramenden geçen her sinir doğru sayılır (örn. jugular foramen: IX, X, XI)
+        item = catalog.cn_by_label[correct]
+        accepted = [c["cn"] for c in catalog.nerves_by_foramen[item["foramen"]]]
+    else:
+        accepted = (correct,)
+    return matcher.accepts(user, accepted)
@@ -0,0 +1,115 @@
+"""
+Searchable index over one user's wrong answers (the Review tab).
+
+Identical misses (same question, same normalized answer) are merged into one entry
+with a count and first/last time. Entries are kept newest first and indexed by item,
+mode and tab, so a page is one pass from a cursor over the matching entries and
+is rendered as a single table.
+
+The index is built once per change of the wrongs list (at most WRONGS_KEEP entries)
+and reused across reruns.
+"""
+from bisect import bisect_right
+from typing import Callable, Iterable
+
+from matching import normalize
+
+PAGE_SIZE = 20
+
+Cursor = tuple[int, str]  # (-last_ts, key) of the last entry shown
+
+
+def signature(wrongs: list[dict]) -> tuple:
+    """Changes whenever wrongs are added, trimmed or cleared (cheap, no hashing)."""
+    if not wrongs:
+        return (0,)
+    first, last = wrongs[0], wrongs[-1]
+    return len(wrongs), first.get("ts"), last.get("ts"), last["q"], last["user"]
+
+
+class ReviewIndex:
+    def __init__(self, wrongs: Iterable[dict], describe: Callable[[str], str] | None = None):
+        # describe(item) -> extra searchable words for an item (name, Latin name, foramen...)
+        by_key: dict[str, dict] = {}
+        for w in wrongs:
+            qid = w.get("qid")
+            key = f"{qid or w['q']}\x00{normalize(w['user'])}"
+            ts = int(w.get("ts") or 0)
+            e = by_key.get(key)
+            if e is None:
+                item, mode = qid.rsplit(":", 1) if qid else ("", "")
+                by_key[key] = {
+                    "key": key, "q": w["q"], "item": item, "mode": mode, "tab": w.get("tab") or "",
+                    "user": w["user"], "correct": w["correct"], "count": 1, "first_ts": ts, "last_ts": ts,
+                    "text": normalize(" ".join((w["q"], w["user"], w["correct"], describe(item) if describe and item else ""))),
+                }
+            else:
+                e["count"] += 1
+                e["first_ts"] = min(e["first_ts"], ts)
+                if ts >= e["last_ts"]:
+                    e["last_ts"] = ts
+                    e["tab"] = w.get("tab") or e["tab"]
+
+        self.entries = sorted(by_key.values(), key=lambda e: (-e["last_ts"], e["key"]))
+        self._order: list[Cursor] = [(-e["last_ts"], e["key"]) for e in self.entries]
+        self.by_item: dict[str, set[int]] = {}
+        self.by_mode: dict[str, set[int]] = {}
+        self.by_tab: dict[str, set[int]] = {}
+        for i, e in enumerate(self.entries):
+            self.by_item.setdefault(e["item"], set()).add(i)
+            self.by_mode.setdefault(e["mode"], set()).add(i)
+            self.by_tab.setdefault(e["tab"], set()).add(i)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def modes(self) -> list[str]:
+        return sorted(m for m in self.by_mode if m)
+
+    def tabs(self) -> list[str]:
+        return sorted(t for t in self.by_tab if t)
+
+    def _union(self, postings: dict[str, set[int]], keys: Iterable[str]) -> set[int]:
+        out: set[int] = set()
+        for k in keys:
+            out |= postings.get(k, set())
+        return out
+
+    def query(self, text: str = "", prefix: str = "", modes: Iterable[str] = (), tabs: Iterable[str] = (),
+              since: int | None = None, after: Cursor | None = None,
+              limit: int = PAGE_SIZE) -> tuple[list[dict], Cursor | None, int]:
+        """
+        One page of entries, newest first: (rows, cursor of the next page or None, total matches).
+        `text` must match every word (name, answer, Latin name, ...); `prefix` filters
+        items ("bone:" / "cn:"); `since` is the oldest last_ts to include.
+        """
+        allowed: set[int] | None = None
+        for postings, keys in ((self.by_mode, modes), (self.by_tab, tabs)):
+            keys = list(keys)
+            if keys:
+                hit = self._union(postings, keys)
+                allowed = hit if allowed is None else allowed & hit
+        if prefix:
+            hit = self._union(self.by_item, (k for k in self.by_item if k.startswith(prefix)))
+            allowed = hit if allowed is None else allowed & hit
+        words = normalize(text).split()
+
+        # entries are sorted newest first, so the date range is a slice
+        end = bisect_right(self._order, (-since, "\U0010ffff")) if since is not None else len(self.entries)
+        start = bisect_right(self._order, after) if after is not None else 0
+        rows: list[dict] = []
+        total = 0
+        more = False
+        candidates = sorted(i for i in allowed if i < end) if allowed is not None else range(end)
+        for i in candidates:
+            e = self.entries[i]
+            if words and not all(w in e["text"] for w in words):
+                continue
+            total += 1
+            if i >= start:
+                if len(rows) < limit:
+                    rows.append(e)
+                else:
+                    more = True
+        cursor = (-rows[-1]["last_ts"], rows[-1]["key"]) if more else None
+        return rows, cursor, total
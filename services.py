@@ -0,0 +1,77 @@
+"""
+Process-wide resources shared by all sessions: content, storage, journal, background
+writer, images and run timings. Each is built on first use and cached for the life of
+the process, so a rerun only does session work.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import streamlit as st
+
+import config
+from analytics import with_cohort
+from assets import ImageAssets
+from catalog import Catalog, load_catalog
+from journal import AnswerJournal, trim_wrongs
+from matching import Matcher
+from metrics import METRICS, TextfileExporter
+from questions import backfill_question_ids
+from storage import CachedUserStore, open_store
+from timing import RunTimes
+from writer import BackgroundWriter
+
+
+@st.cache_resource
+def get_catalog() -> Catalog:
+    # content comes from the packs/ directory (see catalog.py)
+    return load_catalog(config.PACKS_DIR)
+
+
+@st.cache_resource
+def get_matcher() -> Matcher:
+    # normalized answers + aliases + typo index, compiled once per catalog
+    return Matcher(get_catalog())
+
+
+@st.cache_resource
+def get_store() -> CachedUserStore:
+    # one SQLite handle + record cache per process, shared by all sessions;
+    # users.json is migrated on first open
+    config.DATA_DIR.mkdir(exist_ok=True)
+    return CachedUserStore(open_store(config.USERS_DB, config.LEGACY_USERS_JSON), max_bytes=config.USER_CACHE_MAX_BYTES)
+
+
+@st.cache_resource
+def get_journal() -> AnswerJournal:
+    journal = AnswerJournal(config.JOURNAL_DIR, get_store(), wrongs_keep=config.WRONGS_KEEP, aggregate=with_cohort)
+    # after journal recovery, so replayed old answers get tagged too
+    get_store().migrate("question_ids", partial(backfill_question_ids, get_catalog()))
+    get_store().migrate("bounded_wrongs", lambda rec: trim_wrongs(rec, config.WRONGS_KEEP))
+    return journal
+
+
+@st.cache_resource
+def get_writer() -> BackgroundWriter:
+    return BackgroundWriter(get_journal())
+
+
+@st.cache_resource
+def get_assets() -> ImageAssets:
+    # manifest + variants built once per process; no stat() calls per rerun
+    return ImageAssets(config.ASSETS_DIR, config.ASSET_CACHE_DIR, max_bytes=config.IMAGE_CACHE_MAX_BYTES)
+
+
+@st.cache_resource
+def get_prefetch_pool() -> ThreadPoolExecutor:
+    # shared by every session's Prefetcher (prefetch.py); the work is mostly file reads
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+
+
+@st.cache_resource
+def get_run_times() -> RunTimes:
+    return RunTimes()
+
+
+@st.cache_resource
+def get_metrics_exporter() -> TextfileExporter | None:
+    return TextfileExporter(METRICS, config.METRICS_DIR) if config.METRICS_DIR else None
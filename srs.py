@@ -0,0 +1,53 @@
+import heapq
+import random
+
+# SM-2 spaced repetition, simplified to pass/fail answers.
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+RELEARN_SECONDS = 60  # a missed item is due again from the next round on (a deck is fixed at its start)
+DAY = 24 * 60 * 60
+
+
+def new_state() -> dict:
+    return {"ease": DEFAULT_EASE, "ivl": 0, "due": 0, "reps": 0}
+
+
+def review(state: dict | None, ok: bool, now: int) -> dict:
+    """Next scheduling state of an item after one answer (the input is not modified)."""
+    s = dict(state) if state else new_state()
+    if ok:
+        s["reps"] += 1
+        if s["reps"] == 1:
+            s["ivl"] = DAY
+        elif s["reps"] == 2:
+            s["ivl"] = 6 * DAY
+        else:
+            s["ivl"] = int(s["ivl"] * s["ease"])
+        s["ease"] = round(s["ease"] + 0.1, 2)
+    else:
+        s["reps"] = 0
+        s["ivl"] = RELEARN_SECONDS
+        s["ease"] = max(MIN_EASE, round(s["ease"] - 0.2, 2))
+    s["due"] = now + s["ivl"]
+    return s
+
+
+# -------------------- QUEUE --------------------
+# A heap of (due, tiebreak, item). Items never seen have due=0 and come first.
+def build_queue(items: list[str], states: dict, weights: dict | None = None, rng=random) -> list:
+    heap = []
+    for item in items:
+        s = states.get(item)
+        w = weights.get(item, 1) if weights else 1
+        # weighted random order among items due at the same time (larger u**(1/w) first)
+        heap.append((s["due"] if s else 0, -rng.random() ** (1 / w), item))
+    heapq.heapify(heap)
+    return heap
+
+
+def pop_next(heap: list) -> str:
+    return heapq.heappop(heap)[2]
+
+
+def push(heap: list, item: str, due: float, rng=random) -> None:
+    heapq.heappush(heap, (due, -rng.random(), item))
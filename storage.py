@@ -0,0 +1,596 @@
+import copy
+import json
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, file locks only serialize threads of this process
+    fcntl = None
+
+from metrics import inc, timed
+
+
+def new_record() -> dict:
+    return {
+        "stats": {"correct": 0, "total": 0},
+        "wrongs": [],  # list of {q,user,correct,ts,qid}
+        "misses": {},  # qid -> wrong answer count
+        "srs": {},  # item -> spaced-repetition state (see srs.py)
+        "attempts": {},  # qid -> [answers, correct] (see calibrate.py)
+    }
+
+
+def is_user_id(uid: str) -> bool:
+    # ids starting with "__" are shared records (e.g. analytics.COHORT_ID), not students
+    return not uid.startswith("__")
+
+
+class VersionConflict(RuntimeError):
+    """A compare-and-swap write kept losing to writers in other sessions or processes."""
+
+
+_file_locks: dict[str, threading.Lock] = {}
+_file_locks_guard = threading.Lock()
+
+
+@contextmanager
+def file_lock(path: Path):
+    """
+    Exclusive advisory lock on `path` (created if missing), held by one thread of one
+    process at a time. flock is per open file, so threads also take a process-local lock.
+    """
+    key = str(Path(path).resolve())
+    with _file_locks_guard:
+        local = _file_locks.setdefault(key, threading.Lock())
+    with local:
+        with open(key, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# -------------------- INTERFACE --------------------
+class UserStore:
+    """
+    Per-user record storage. Every backend keys records by user ID.
+
+    Each write gets a sequence number (`seq`) that only grows, so caches can ask
+    which records changed since the last time they looked.
+    """
+
+    def get_versioned(self, uid: str) -> tuple[dict, int] | None:
+        raise NotImplementedError
+
+    def put(self, uid: str, record: dict) -> int:
+        raise NotImplementedError
+
+    def update_versioned(self, uid: str, fn: Callable[[dict], None]) -> tuple[dict, int]:
+        """Atomic read-modify-write of one record; creates it if missing."""
+        raise NotImplementedError
+
+    def compare_and_put(self, uid: str, record: dict, expected_seq: int) -> int | None:
+        """
+        Write `record` only if the stored version is still `expected_seq` (0: the record
+        must not exist yet). Returns the new seq, or None if someone else wrote first.
+        """
+        raise NotImplementedError
+
+    def update_optimistic(self, uid: str, fn: Callable[[dict], None], retries: int = 8) -> tuple[dict, int]:
+        """
+        Read-modify-write without holding a lock while `fn` runs: `fn` gets a copy of the
+        current version, which is written back with compare_and_put. If another writer
+        got there first, `fn` runs again on the newer version.
+        """
+        for attempt in range(retries):
+            hit = self.get_versioned(uid)
+            rec, expected = (copy.deepcopy(hit[0]), hit[1]) if hit else (new_record(), 0)
+            fn(rec)
+            seq = self.compare_and_put(uid, rec, expected)
+            if seq is not None:
+                return rec, seq
+            inc("skull_storage_conflicts_total")
+            time.sleep(random.uniform(0, 0.005 * 2 ** attempt))  # back off so retries don't collide again
+        raise VersionConflict(uid)
+
+    def update_many(self, fns: dict[str, Callable[[dict], None]], marker: str | None = None) -> dict[str, tuple[dict, int]]:
+        """
+        Apply several record updates together. With `marker`, a backend that supports it
+        applies the batch at most once: a second call with the same marker is a no-op.
+        """
+        return {uid: self.update_versioned(uid, fn) for uid, fn in fns.items()}
+
+    def drop_marker(self, marker: str) -> None:
+        pass
+
+    def migrate(self, name: str, fn: Callable[[dict], bool]) -> int:
+        """
+        Run `fn` over every record and save the ones it changed (it returns True).
+        Backends with markers run each named migration only once.
+        """
+        n = 0
+        for uid, rec in list(self.items()):
+            if fn(rec):
+                self.put(uid, rec)
+                n += 1
+        return n
+
+    def changed_since(self, seq: int) -> list[tuple[str, int]]:
+        """(uid, seq) of every record written after `seq`."""
+        raise NotImplementedError
+
+    def may_have_changed(self) -> bool:
+        """
+        Cheap change feed: False only if no other writer can have committed since this
+        thread last asked, so changed_since can be skipped.
+        """
+        return True
+
+    def last_seq(self) -> int:
+        raise NotImplementedError
+
+    def items(self) -> Iterator[tuple[str, dict]]:
+        """Every user record (shared records are left out)."""
+        raise NotImplementedError
+
+    def get(self, uid: str) -> dict | None:
+        hit = self.get_versioned(uid)
+        return hit[0] if hit else None
+
+    def update(self, uid: str, fn: Callable[[dict], None]) -> dict:
+        return self.update_versioned(uid, fn)[0]
+
+    def get_or_create(self, uid: str) -> dict:
+        rec = self.get(uid)
+        if rec is None:
+            rec = self.update(uid, lambda r: None)
+        return rec
+
+
+# -------------------- LEGACY JSON --------------------
+class JsonUserStore(UserStore):
+    """
+    The old single users.json file. Every call rewrites the whole file; seq is the file mtime.
+    Writes hold an advisory lock on users.json.lock, so processes sharing the file don't
+    overwrite each other's changes.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock_path = self.path.with_name(self.path.name + ".lock")
+
+    @timed("skull_storage_load_seconds", backend="json")
+    def _load(self) -> dict:
+        if not self.path.exists():
+            return {}
+        try:
+            raw = self.path.read_text(encoding="utf-8")
+            inc("skull_storage_read_bytes_total", len(raw), backend="json")
+            return json.loads(raw)
+        except Exception:
+            return {}
+
+    def _mtime(self) -> int:
+        try:
+            return self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def get_versioned(self, uid: str) -> tuple[dict, int] | None:
+        seq = self._mtime()
+        rec = self._load().get(uid)
+        return (rec, seq) if rec is not None else None
+
+    @timed("skull_storage_save_seconds", backend="json")
+    def _save(self, db: dict) -> int:
+        # write a temp file and rename it, so readers never see a half-written file
+        raw = json.dumps(db, ensure_ascii=False, indent=2)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(raw, encoding="utf-8")
+        tmp.replace(self.path)
+        inc("skull_storage_written_bytes_total", len(raw), backend="json")
+        return self._mtime()
+
+    def put(self, uid: str, record: dict) -> int:
+        with file_lock(self._lock_path):
+            db = self._load()
+            db[uid] = record
+            return self._save(db)
+
+    def compare_and_put(self, uid: str, record: dict, expected_seq: int) -> int | None:
+        with file_lock(self._lock_path):
+            db = self._load()
+            # the file has one version for all records
+            if (self._mtime() if uid in db else 0) != expected_seq:
+                return None
+            db[uid] = record
+            return self._save(db)
+
+    def update_versioned(self, uid: str, fn: Callable[[dict], None]) -> tuple[dict, int]:
+        with file_lock(self._lock_path):
+            db = self._load()
+            rec = db.setdefault(uid, new_record())
+            fn(rec)
+            return rec, self._save(db)
+
+    def changed_since(self, seq: int) -> list[tuple[str, int]]:
+        mtime = self._mtime()
+        if mtime <= seq:
+            return []
+        return [(uid, mtime) for uid in self._load()]
+
+    def last_seq(self) -> int:
+        return self._mtime()
+
+    def items(self) -> Iterator[tuple[str, dict]]:
+        yield from ((uid, rec) for uid, rec in self._load().items() if is_user_id(uid))
+
+
+# -------------------- SQLITE (WAL) --------------------
+POOL_SIZE = 8  # idle connections kept per store; more are opened under load and closed after use
+
+
+class SqliteUserStore(UserStore):
+    """
+    One row per user, updated in its own transaction.
+    WAL mode lets readers keep going while a writer commits. Several processes on one
+    host can share the file: SQLite's own file locks serialize the write transactions,
+    and every write bumps the record's seq (its version, used by compare_and_put).
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._idle: list[sqlite3.Connection] = []
+        self._pool_lock = threading.Lock()
+        self._watch: sqlite3.Connection | None = None  # change detection only (may_have_changed)
+        self._watch_lock = threading.Lock()
+        self._data_version: int | None = None
+        with self._connection() as con:
+            # one write transaction, so processes opening a new file together don't race
+            con.execute("BEGIN IMMEDIATE")
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                " uid TEXT PRIMARY KEY,"
+                " data TEXT NOT NULL,"
+                " updated_at INTEGER NOT NULL DEFAULT (strftime('%s','now'))"
+                ")"
+            )
+            con.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            con.execute("INSERT OR IGNORE INTO meta(key, value) VALUES('seq', 0)")
+            cols = {r[1] for r in con.execute("PRAGMA table_info(users)")}
+            if "seq" not in cols:
+                con.execute("ALTER TABLE users ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+            con.execute("CREATE INDEX IF NOT EXISTS users_seq ON users(seq)")
+            con.execute("CREATE TABLE IF NOT EXISTS markers (name TEXT PRIMARY KEY)")
+            con.execute("COMMIT")
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        # Streamlit runs every rerun in a new thread, so connections are pooled per store
+        # instead of per thread; each one is used by one thread at a time
+        with self._pool_lock:
+            con = self._idle.pop() if self._idle else None
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+        try:
+            yield con
+        finally:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            with self._pool_lock:
+                if len(self._idle) < POOL_SIZE:
+                    self._idle.append(con)
+                    con = None
+            if con is not None:
+                con.close()
+
+    @timed("skull_storage_save_seconds", backend="sqlite")
+    def _write(self, con: sqlite3.Connection, uid: str, record: dict) -> int:
+        # caller holds the write transaction
+        con.execute("UPDATE meta SET value = value + 1 WHERE key = 'seq'")
+        seq = con.execute("SELECT value FROM meta WHERE key = 'seq'").fetchone()[0]
+        data = json.dumps(record, ensure_ascii=False)
+        con.execute(
+            "INSERT INTO users(uid, data, seq) VALUES(?, ?, ?) "
+            "ON CONFLICT(uid) DO UPDATE SET data = excluded.data, seq = excluded.seq, "
+            "updated_at = strftime('%s','now')",
+            (uid, data, seq),
+        )
+        inc("skull_storage_written_bytes_total", len(data), backend="sqlite")
+        return seq
+
+    @staticmethod
+    def _decode(data: str) -> dict:
+        inc("skull_storage_read_bytes_total", len(data), backend="sqlite")
+        return json.loads(data)
+
+    @timed("skull_storage_load_seconds", backend="sqlite")
+    def get_versioned(self, uid: str) -> tuple[dict, int] | None:
+        with self._connection() as con:
+            row = con.execute("SELECT data, seq FROM users WHERE uid = ?", (uid,)).fetchone()
+        return (self._decode(row[0]), row[1]) if row else None
+
+    def put(self, uid: str, record: dict) -> int:
+        with self._connection() as con:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                seq = self._write(con, uid, record)
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            return seq
+
+    def compare_and_put(self, uid: str, record: dict, expected_seq: int) -> int | None:
+        with self._connection() as con:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                row = con.execute("SELECT seq FROM users WHERE uid = ?", (uid,)).fetchone()
+                if (row[0] if row else 0) != expected_seq:
+                    con.execute("ROLLBACK")
+                    return None
+                seq = self._write(con, uid, record)
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            return seq
+
+    def update_versioned(self, uid: str, fn: Callable[[dict], None]) -> tuple[dict, int]:
+        with self._connection() as con:
+            # IMMEDIATE takes the write lock up front so two sessions can't interleave read/write
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                row = con.execute("SELECT data FROM users WHERE uid = ?", (uid,)).fetchone()
+                rec = self._decode(row[0]) if row else new_record()
+                fn(rec)
+                seq = self._write(con, uid, rec)
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            return rec, seq
+
+    def update_many(self, fns: dict[str, Callable[[dict], None]], marker: str | None = None) -> dict[str, tuple[dict, int]]:
+        with self._connection() as con:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                if marker is not None and con.execute("SELECT 1 FROM markers WHERE name = ?", (marker,)).fetchone():
+                    con.execute("ROLLBACK")
+                    return {}
+                out = {}
+                for uid, fn in fns.items():
+                    row = con.execute("SELECT data FROM users WHERE uid = ?", (uid,)).fetchone()
+                    rec = self._decode(row[0]) if row else new_record()
+                    fn(rec)
+                    out[uid] = rec, self._write(con, uid, rec)
+                if marker is not None:
+                    con.execute("INSERT INTO markers(name) VALUES(?)", (marker,))
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            return out
+
+    def drop_marker(self, marker: str) -> None:
+        with self._connection() as con:
+            con.execute("DELETE FROM markers WHERE name = ?", (marker,))
+
+    def migrate(self, name: str, fn: Callable[[dict], bool]) -> int:
+        marker = f"migration:{name}"
+        with self._connection() as con:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                if con.execute("SELECT 1 FROM markers WHERE name = ?", (marker,)).fetchone():
+                    con.execute("ROLLBACK")
+                    return 0
+                n = 0
+                for uid, data in con.execute("SELECT uid, data FROM users WHERE substr(uid, 1, 2) != '__'").fetchall():
+                    rec = json.loads(data)
+                    if fn(rec):
+                        self._write(con, uid, rec)
+                        n += 1
+                con.execute("INSERT INTO markers(name) VALUES(?)", (marker,))
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            return n
+
+    def changed_since(self, seq: int) -> list[tuple[str, int]]:
+        with self._connection() as con:
+            return con.execute("SELECT uid, seq FROM users WHERE seq > ?", (seq,)).fetchall()
+
+    def may_have_changed(self) -> bool:
+        # PRAGMA data_version is per connection and changes when any other connection (this
+        # process's pool included) commits, so one dedicated connection answers for the store
+        with self._watch_lock:
+            if self._watch is None:
+                self._watch = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            version = self._watch.execute("PRAGMA data_version").fetchone()[0]
+            changed = version != self._data_version
+            self._data_version = version
+        return changed
+
+    def last_seq(self) -> int:
+        with self._connection() as con:
+            return con.execute("SELECT value FROM meta WHERE key = 'seq'").fetchone()[0]
+
+    def items(self) -> Iterator[tuple[str, dict]]:
+        with self._connection() as con:
+            for uid, data in con.execute("SELECT uid, data FROM users WHERE substr(uid, 1, 2) != '__' ORDER BY uid"):
+                yield uid, json.loads(data)
+
+
+# -------------------- CACHE --------------------
+class CachedUserStore(UserStore):
+    """
+    Process-wide LRU cache in front of another store, shared by every session.
+
+    Writes go through the cache, so they update it directly. Writes made by other
+    processes are picked up by `sync()`, which asks the backend which records changed
+    since the last sync (only if its change counter moved); call it once per rerun. Records handed out are shared,
+    treat them as read-only and change them only through `update()`.
+    """
+
+    def __init__(self, inner: UserStore, max_bytes: int = 32 * 1024 * 1024):
+        self.inner = inner
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[dict, int, int]] = OrderedDict()  # uid -> (rec, seq, size)
+        self._bytes = 0
+        self._seen = inner.last_seq()
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _store(self, uid: str, rec: dict, seq: int, seen: int | None = None) -> None:
+        # seen: self._seen when the backend read started; if a sync ran since, the read may
+        # predate a write that sync has already skipped past, so it isn't cached
+        size = len(json.dumps(rec, ensure_ascii=False))
+        with self._lock:
+            if seen is not None and seen != self._seen:
+                return
+            old = self._entries.get(uid)
+            if old is not None:
+                if old[1] > seq:
+                    return  # a newer version is already cached
+                self._bytes -= old[2]
+            self._entries[uid] = (rec, seq, size)
+            self._entries.move_to_end(uid)
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, _, dropped) = self._entries.popitem(last=False)
+                self._bytes -= dropped
+                self.evictions += 1
+
+    def _drop(self, uid: str) -> None:
+        old = self._entries.pop(uid, None)
+        if old is not None:
+            self._bytes -= old[2]
+            self.invalidations += 1
+
+    def sync(self) -> None:
+        # one sync at a time: a caller told "nothing changed" must not return while another
+        # is still dropping what did change
+        with self._sync_lock:
+            if not self.inner.may_have_changed():
+                return
+            changed = self.inner.changed_since(self._seen)
+            if not changed:
+                return
+            with self._lock:
+                for uid, seq in changed:
+                    cur = self._entries.get(uid)
+                    if cur is not None and cur[1] < seq:
+                        self._drop(uid)
+                    self._seen = max(self._seen, seq)
+
+    def get_versioned(self, uid: str) -> tuple[dict, int] | None:
+        with self._lock:
+            cur = self._entries.get(uid)
+            if cur is not None:
+                self._entries.move_to_end(uid)
+                self.hits += 1
+                return cur[0], cur[1]
+            self.misses += 1
+            seen = self._seen
+        hit = self.inner.get_versioned(uid)
+        if hit is not None:
+            self._store(uid, *hit, seen=seen)
+        return hit
+
+    def put(self, uid: str, record: dict) -> int:
+        seq = self.inner.put(uid, record)
+        self._store(uid, record, seq)
+        return seq
+
+    def update_versioned(self, uid: str, fn: Callable[[dict], None]) -> tuple[dict, int]:
+        rec, seq = self.inner.update_versioned(uid, fn)
+        self._store(uid, rec, seq)
+        return rec, seq
+
+    def compare_and_put(self, uid: str, record: dict, expected_seq: int) -> int | None:
+        seq = self.inner.compare_and_put(uid, record, expected_seq)
+        if seq is None:
+            with self._lock:
+                self._drop(uid)  # the cached version is stale; the retry reads the backend
+            return None
+        self._store(uid, record, seq)
+        return seq
+
+    def update_many(self, fns: dict[str, Callable[[dict], None]], marker: str | None = None) -> dict[str, tuple[dict, int]]:
+        out = self.inner.update_many(fns, marker)
+        for uid, (rec, seq) in out.items():
+            self._store(uid, rec, seq)
+        return out
+
+    def drop_marker(self, marker: str) -> None:
+        self.inner.drop_marker(marker)
+
+    def migrate(self, name: str, fn: Callable[[dict], bool]) -> int:
+        n = self.inner.migrate(name, fn)
+        if n:
+            self.sync()
+        return n
+
+    def changed_since(self, seq: int) -> list[tuple[str, int]]:
+        return self.inner.changed_since(seq)
+
+    def last_seq(self) -> int:
+        return self.inner.last_seq()
+
+    def may_have_changed(self) -> bool:
+        return self.inner.may_have_changed()
+
+    def items(self) -> Iterator[tuple[str, dict]]:
+        return self.inner.items()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "invalidations": self.invalidations, "records": len(self._entries), "bytes": self._bytes,
+            }
+
+
+# -------------------- MIGRATION --------------------
+def migrate_json(json_path: Path, store: UserStore) -> int:
+    """Copy every record from an old users.json into `store`. Returns the number of users."""
+    src = JsonUserStore(json_path)
+    n = 0
+    for uid, rec in src.items():
+        if isinstance(rec, dict):
+            store.put(uid, rec)
+            n += 1
+    return n
+
+
+def open_store(db_path: Path, legacy_json: Path | None = None) -> UserStore:
+    """
+    Open the SQLite store; if the legacy users.json is still there, import it once
+    and rename it so the migration doesn't run again.
+    """
+    store = SqliteUserStore(db_path)
+    if legacy_json is not None and Path(legacy_json).exists():
+        # replicas starting together: only one imports, the others wait and then find it
+        # renamed (without the lock a late import could overwrite fresh answers)
+        with file_lock(Path(db_path).with_name(Path(db_path).name + ".lock")):
+            if Path(legacy_json).exists():
+                migrate_json(legacy_json, store)
+                Path(legacy_json).rename(Path(legacy_json).with_name(Path(legacy_json).name + ".migrated"))
+    return store
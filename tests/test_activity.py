@@ -0,0 +1,52 @@
+from datetime import date
+
+from activity import COUNT_DAYS, active_days, current_streak, heatmap, mark_day
+
+DAY = date(2026, 3, 4).toordinal()  # a Wednesday
+
+
+def test_streak_counts_consecutive_days_and_breaks_on_gaps():
+    rec = {}
+    for d in (0, 1, 2):
+        mark_day(rec, DAY + d)
+    act = rec["activity"]
+    assert (act["streak"], act["best"]) == (3, 3)
+    mark_day(rec, DAY + 5)
+    assert (act["streak"], act["best"]) == (1, 3)
+    assert active_days(act) == 4
+    assert current_streak(act, DAY + 6) == 1
+    assert current_streak(act, DAY + 7) == 0
+
+
+def test_late_event_fills_an_older_day():
+    rec = {}
+    for d in (0, 2, 3):
+        mark_day(rec, DAY + d)
+    assert rec["activity"]["streak"] == 2
+    mark_day(rec, DAY + 1, answers=2)  # replayed journal from the day before
+    act = rec["activity"]
+    assert (act["streak"], act["best"]) == (4, 4)
+    assert act["counts"][:4] == [1, 1, 2, 1]
+
+
+def test_answers_per_day_are_counted_and_bounded():
+    rec = {}
+    mark_day(rec, DAY)
+    mark_day(rec, DAY, answers=3)
+    assert rec["activity"]["counts"] == [4]
+    mark_day(rec, DAY + 2 * COUNT_DAYS)
+    act = rec["activity"]
+    assert len(act["counts"]) == COUNT_DAYS
+    assert active_days(act) == 2
+
+
+def test_heatmap_ends_with_the_current_week():
+    rec = {}
+    mark_day(rec, DAY - 7, answers=5)
+    mark_day(rec, DAY, answers=2)
+    grid = heatmap(rec["activity"], DAY, weeks=2)
+    assert grid == [[0, 0, 5, 0, 0, 0, 0], [0, 0, 2, None, None, None, None]]
+    # viewed two days later: nothing new, same cells
+    assert heatmap(rec["activity"], DAY + 2, weeks=2)[1][:3] == [0, 0, 2]
+    assert heatmap(None, DAY, weeks=1) == [[0, 0, 0, None, None, None, None]]
+
@@ -0,0 +1,64 @@
+import pytest
+
+import analytics
+from analytics import (COHORT_ID, LEADERBOARD_SIZE, _offer, count_week, hardest, leaderboard, mode_accuracy,
+                       new_cohort, week_id, with_cohort)
+
+TS = 1_760_000_000  # 2025-10-09, ISO week 41
+WEEK = 7 * 24 * 60 * 60
+
+
+def test_leaderboard_keeps_the_top_of_the_week():
+    cohort = new_cohort()
+    for i in range(LEADERBOARD_SIZE + 5):
+        _offer(cohort, f"u{i}", {"id": "2025-W41", "correct": i, "answers": 20})
+    assert [r["uid"] for r in leaderboard(cohort)][:3] == ["u14", "u13", "u12"]
+    assert len(cohort["leaderboard"]) == LEADERBOARD_SIZE
+    _offer(cohort, "u5", {"id": "2025-W41", "correct": 99, "answers": 99})  # not on the board yet
+    _offer(cohort, "u14", {"id": "2025-W41", "correct": 100, "answers": 100})  # already on it: updated in place
+    board = leaderboard(cohort)
+    assert [r["uid"] for r in board[:2]] == ["u14", "u5"]
+    assert [r["uid"] for r in board].count("u14") == 1
+
+
+def test_new_week_resets_and_late_weeks_are_ignored():
+    cohort = new_cohort()
+    _offer(cohort, "a", {"id": "2025-W41", "correct": 5, "answers": 5})
+    _offer(cohort, "b", {"id": "2025-W42", "correct": 1, "answers": 1})
+    _offer(cohort, "c", {"id": "2025-W41", "correct": 9, "answers": 9})
+    assert cohort["week"] == "2025-W42"
+    assert [r["uid"] for r in leaderboard(cohort)] == ["b"]
+
+
+def test_count_week_rolls_over():
+    rec = {}
+    count_week(rec, TS, True)
+    count_week(rec, TS, False)
+    assert rec["week"] == {"id": week_id(TS), "answers": 2, "correct": 1}
+    count_week(rec, TS + WEEK, True)
+    count_week(rec, TS, True)  # late event from last week
+    assert rec["week"] == {"id": week_id(TS + WEEK), "answers": 1, "correct": 1}
+
+
+def test_fold_hook_updates_users_and_the_cohort_together():
+    events = {"a": [{"t": "review", "item": "bone:Frontal", "qid": "bone:Frontal:latin", "ok": ok, "ts": TS}
+                    for ok in (True, False, False, False, False)],
+              "b": [{"t": "review", "item": "cn:CN X", "qid": "cn:CN X:cn_to_foramen", "ok": True, "ts": TS}]}
+
+    def fold(uid):
+        def run(rec):
+            for ev in events[uid]:
+                count_week(rec, ev["ts"], ev["ok"])
+        return run
+
+    fns = with_cohort(events, {uid: fold(uid) for uid in events})
+    records = {uid: {} for uid in fns}
+    for uid, fn in fns.items():  # the store applies them in order; the cohort goes last
+        fn(records[uid])
+    cohort = records[COHORT_ID]
+    assert (cohort["answers"], cohort["correct"]) == (6, 2)
+    assert mode_accuracy(cohort) == pytest.approx({"latin": 0.2, "cn_to_foramen": 1.0})
+    assert [(r["item"], r["misses"]) for r in hardest(cohort)] == [("bone:Frontal", 4)]
+    assert hardest(cohort, prefix="cn:", min_attempts=1)[0]["miss_rate"] == 0
+    assert [r["uid"] for r in leaderboard(cohort)] == ["a", "b"]
+    assert analytics._init(cohort) is cohort
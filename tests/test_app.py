@@ -0,0 +1,85 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import config
+
+APP = str(Path(__file__).resolve().parent.parent / "app.py")
+
+
+@pytest.fixture(scope="module")
+def workdir(tmp_path_factory):
+    # the services (store, journal, images) are cached per process and flushed at exit, so
+    # they get absolute paths under one temp dir instead of the cwd-relative defaults
+    d = tmp_path_factory.mktemp("app")
+    with pytest.MonkeyPatch.context() as mp:
+        for name, path in (("DATA_DIR", d / "data"), ("USERS_DB", d / "data/users.db"),
+                           ("LEGACY_USERS_JSON", d / "data/users.json"), ("JOURNAL_DIR", d / "data/journal"),
+                           ("ASSETS_DIR", d / "assets/bones"), ("ASSET_CACHE_DIR", d / "assets/.cache/bones")):
+            mp.setattr(config, name, path)
+        # AppTest leaves app.py as __main__; processes spawned later would run it again
+        mp.setitem(sys.modules, "__main__", sys.modules["__main__"])
+        yield d
+
+
+def start(uid: str) -> AppTest:
+    at = AppTest.from_file(APP, default_timeout=30)
+    at.query_params["u"] = uid
+    at.run()
+    return at
+
+
+def test_expired_exam_closes_without_rerun_loop(workdir):
+    at = start("exam_expired")
+    next(b for b in at.button if b.label == "🧪 Exam başlat").click()
+    at.run()
+    assert at.session_state.exam["running"]
+
+    at.session_state.exam["start"] = time.time() - at.session_state.exam["limit"] - 5
+    at.run(timeout=10)
+    assert not at.exception
+    assert not at.session_state.exam["running"]
+    assert any("Exam bitti" in e.value for e in at.error)
+
+
+def test_exam_timer_only_while_running(workdir):
+    at = start("exam_idle")
+    assert not any("Kalan süre" in m.value for m in at.markdown)
+    next(b for b in at.button if b.label == "🧪 Exam başlat").click()
+    at.run()
+    assert any("Kalan süre" in m.value for m in at.markdown)
+
+
+def exam_caption(at) -> str:
+    return next(c.value for c in at.caption if "Deste kodu" in c.value or "seviyene" in c.value)
+
+
+def test_exam_code_is_only_shown_when_it_reproduces_the_deck(workdir):
+    import services
+    from calibrate import CALIBRATION_ID
+    from deck import BONE_MODES
+    from questions import bone_qid
+
+    at = start("exam_code")
+    next(b for b in at.button if b.label == "🧪 Exam başlat").click()
+    at.run()
+    assert exam_caption(at) == f"🎲 Deste kodu: {at.session_state.exam['seed']}"
+
+    store = services.get_store()
+    difficulty = {bone_qid(b["name"], m): i % 5 - 2.0 for i, b in enumerate(services.get_catalog().bones)
+                  for m in BONE_MODES}
+    store.put(CALIBRATION_ID, {"difficulty": difficulty})
+    try:
+        next(b for b in at.button if b.label == "🧪 Exam başlat").click()
+        at.run()
+        assert "kodla tekrarlanamaz" in exam_caption(at)
+        next(t for t in at.text_input if t.label == "Deste kodu (opsiyonel)").set_value("1234")
+        at.run()  # the browser commits the text box before the click
+        next(b for b in at.button if b.label == "🧪 Exam başlat").click()
+        at.run()
+        assert exam_caption(at) == "🎲 Deste kodu: 1234"
+    finally:
+        store.put(CALIBRATION_ID, {})
@@ -0,0 +1,16 @@
+import pytest
+
+from assets import ImageAssets
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def test_unreadable_image_only_skips_itself(tmp_path):
+    src = tmp_path / "bones"
+    src.mkdir()
+    Image.new("RGB", (800, 400)).save(src / "frontal.png")
+    (src / "parietal.png").write_bytes(b"not an image")
+    assets = ImageAssets(src, tmp_path / "cache")
+    assert assets.path("parietal") is None
+    assert [w for w, _ in assets.manifest["frontal"]] == [320, 640, 800]
+    assert assets.image_bytes("Frontal", 640) == (tmp_path / "cache" / "frontal-640.webp").read_bytes()
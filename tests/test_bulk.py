@@ -0,0 +1,38 @@
+import json
+
+import bulk
+from storage import SqliteUserStore
+
+LEGACY = {"stats": {"correct": 0, "total": 1},
+          "wrongs": [{"q": "**Frontal** kemiğinin Latin adı nedir?", "user": "a", "correct": "Os frontale"}]}
+
+
+def test_cli_import_tags_legacy_wrongs(tmp_path):
+    db = tmp_path / "users.db"
+    SqliteUserStore(db).migrate("question_ids", lambda rec: False)  # already ran on this store
+    src = tmp_path / "cohort.ndjson"
+    src.write_text(json.dumps({"uid": "ayse", "data": LEGACY}) + "\n", encoding="utf-8")
+    assert bulk.main(["--db", str(db), "import", str(src)]) == 0
+    rec = SqliteUserStore(db).get("ayse")
+    assert rec["wrongs"][0]["qid"] == "bone:Frontal:latin"
+    assert rec["misses"] == {"bone:Frontal:latin": 1}
+
+
+def test_bad_lines_are_skipped_without_losing_the_batch(tmp_path):
+    store = SqliteUserStore(tmp_path / "users.db")
+    bad = [{"stats": {}, "wrongs": []},
+           {"stats": {"correct": 0, "total": 0}, "wrongs": [5]},
+           {"stats": {"correct": 0, "total": 0}, "wrongs": [{"q": "q", "correct": "c"}]},
+           {"stats": {"correct": "1", "total": 1}, "wrongs": []}]
+    lines = [json.dumps({"uid": "a", "data": LEGACY})]
+    lines += [json.dumps({"uid": f"b{i}", "data": d}) for i, d in enumerate(bad)]
+    lines += [json.dumps({"uid": "c", "data": {**LEGACY, "wrongs": []}})]
+
+    def prepare(data):
+        if not data["wrongs"]:
+            raise TypeError("boom")
+
+    imported, skipped, errors = bulk.import_lines(lines, store, prepare=prepare)
+    assert (imported, skipped) == (1, 5)
+    assert [no for no, _ in errors] == [2, 3, 4, 5, 6]
+    assert store.get("a")["stats"] == LEGACY["stats"]
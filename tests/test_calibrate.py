@@ -0,0 +1,43 @@
+import numpy as np
+
+from calibrate import CALIBRATION_ID, calibrate, collect, estimate_ability, fit
+from storage import SqliteUserStore
+
+
+def simulated(n_users=200, n_items=30, answers=8, seed=0):
+    rng = np.random.default_rng(seed)
+    theta, b = rng.normal(0, 1, n_users), rng.normal(0, 1, n_items)
+    records = []
+    for ui in range(n_users):
+        p = 1 / (1 + np.exp(b - theta[ui]))
+        correct = rng.binomial(answers, p)
+        records.append((f"u{ui}", {"attempts": {f"q{qi}": [answers, int(c)] for qi, c in enumerate(correct)}}))
+    return records, theta, b
+
+
+def test_fit_recovers_the_simulated_parameters():
+    records, theta, b = simulated()
+    uids, qids, u, q, n, k = collect(records)
+    assert (len(uids), len(qids), len(u)) == (200, 30, 6000)
+    est_t, est_b, iters = fit(u, q, n, k, len(uids), len(qids))
+    assert iters < 100
+    assert np.corrcoef(est_b, b[[int(x[1:]) for x in qids]])[0, 1] > 0.95
+    assert np.corrcoef(est_t, theta)[0, 1] > 0.8
+    # one student's estimate with the difficulties fixed agrees with the joint fit
+    difficulty = dict(zip(qids, est_b))
+    assert abs(estimate_ability(records[0][1]["attempts"], difficulty) - est_t[0]) < 0.1
+
+
+def test_collect_skips_empty_records_and_cells():
+    uids, qids, u, *_ = collect([("a", {}), ("b", {"attempts": {"x": [0, 0], "y": [2, 1]}})])
+    assert (uids, qids, u.tolist()) == (["b"], ["y"], [0])
+
+
+def test_calibrate_saves_the_difficulties(tmp_path):
+    store = SqliteUserStore(tmp_path / "users.db")
+    records, _, _ = simulated(n_users=20, n_items=5)
+    for uid, rec in records:
+        store.put(uid, rec)
+    rec, abilities = calibrate(store)
+    assert store.get(CALIBRATION_ID)["difficulty"] == rec["difficulty"]
+    assert (rec["students"], rec["answers"], len(abilities)) == (20, 800, 20)
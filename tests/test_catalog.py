@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+import config
+from catalog import load_catalog, read_pack
+
+
+def test_shipped_packs_load():
+    catalog = load_catalog(config.PACKS_DIR)
+    assert catalog.bones and catalog.cn_foramina
+
+
+@pytest.mark.parametrize("name, text, error", [
+    ("list.json", json.dumps([{"name": "Frontal"}]), "pack list.json: the top level must be an object"),
+    ("broken.json", "{", "pack broken.json: invalid JSON"),
+    ("extra.bones.csv", "name,latin,category,landmarks\nFrontal,Os frontale,Cranial,Glabella,oops\n",
+     "pack extra.bones.csv: line 2 has more columns"),
+    ("short.cn.csv", "cn,name,foramen\nCN I,Olfactory\n", "pack short.cn.csv: line 2 has fewer columns"),
+])
+def test_bad_packs_report_the_pack(tmp_path, name, text, error):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    with pytest.raises(ValueError, match=error):
+        read_pack(path)
+
+
+def test_csv_pack(tmp_path):
+    path = tmp_path / "extra.bones.csv"
+    path.write_text("name,latin,category,landmarks\n Frontal ,Os frontale,Cranial,Glabella; Supraorbital notch\n",
+                    encoding="utf-8")
+    bones, cns, aliases = read_pack(path)
+    assert bones == [{"name": "Frontal", "latin": "Os frontale", "category": "Cranial",
+                      "landmarks": ["Glabella", "Supraorbital notch"]}]
+    assert (cns, aliases) == ([], {})
@@ -0,0 +1,147 @@
+import sqlite3
+import threading
+import time
+
+from journal import AnswerJournal, apply_event, trim_wrongs
+from storage import SqliteUserStore, new_record
+
+
+def wait_for(cond, timeout=5.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        if cond():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_compaction_survives_a_failing_fold(tmp_path):
+    store = SqliteUserStore(tmp_path / "users.db")
+    journal = AnswerJournal(tmp_path / "journal", store, compact_interval=0.05)
+    update_many = store.update_many
+    calls = []
+
+    def locked_once(fns, marker=None):
+        calls.append(marker)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return update_many(fns, marker)
+
+    store.update_many = locked_once
+    journal.append("u", {"t": "stats", "correct": 1, "total": 1})
+    assert wait_for(lambda: (store.get("u") or {}).get("stats", {}).get("total") == 1)
+    assert len(calls) >= 2  # the first fold failed, the loop kept going
+    journal.append("u", {"t": "stats", "correct": 0, "total": 1})
+    assert wait_for(lambda: store.get("u")["stats"]["total"] == 2)
+    journal.close()
+
+
+def test_recover_skips_directories_of_starting_processes(tmp_path):
+    root = tmp_path / "journal"
+    starting = root / ".otherhost-1-abcdef"
+    starting.mkdir(parents=True)
+    (starting / "00.0.ndjson").write_text('{"uid": "u", "t": "stats", "correct": 1, "total": 1}\n')
+    store = SqliteUserStore(tmp_path / "users.db")
+    journal = AnswerJournal(root, store)
+    assert starting.exists()
+    assert store.get("u") is None
+    assert journal.dir.exists() and not journal.dir.name.startswith(".")
+    journal.close()
+
+
+def test_journal_paths_survive_a_cwd_change(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = SqliteUserStore(tmp_path / "users.db")
+    journal = AnswerJournal("journal", store)
+    journal.append("u", {"t": "stats", "correct": 1, "total": 1})
+    monkeypatch.chdir("/")
+    journal.close()
+    assert store.get("u")["stats"]["total"] == 1
+
+
+def wrong_event(i, qid="bone:Frontal:latin"):
+    return {"t": "wrong", "q": f"q{i}", "user": "u", "correct": "c", "ts": 1000 + i, "qid": qid, "tab": "quiz"}
+
+
+def test_reads_do_not_wait_for_a_blocked_fold(tmp_path):
+    store = SqliteUserStore(tmp_path / "users.db")
+    journal = AnswerJournal(tmp_path / "journal", store, compact_interval=3600)
+    store.put("other", new_record())
+    journal.append("u", {"t": "stats", "correct": 1, "total": 1})
+    blocker = sqlite3.connect(tmp_path / "users.db", isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")  # another process holds the write lock
+    folding = threading.Thread(target=journal.compact)
+    folding.start()
+    time.sleep(0.2)
+    t = time.perf_counter()
+    assert journal.view("other")["stats"]["total"] == 0
+    assert journal.view("u")["stats"]["total"] == 1
+    journal.append("u", {"t": "stats", "correct": 0, "total": 1})
+    assert time.perf_counter() - t < 1
+    blocker.execute("ROLLBACK")
+    folding.join()
+    assert store.get("u")["stats"]["total"] == 1
+    assert journal.view("u")["stats"]["total"] == 2  # the folded event is not applied twice
+    journal.close()
+    assert store.get("u")["stats"]["total"] == 2
+
+
+def test_view_skips_events_a_concurrent_fold_already_committed(tmp_path):
+    store = SqliteUserStore(tmp_path / "users.db")
+    journal = AnswerJournal(tmp_path / "journal", store, compact_interval=3600)
+    journal.append("u", {"t": "stats", "correct": 1, "total": 1})
+    update_many = store.update_many
+
+    def commit_then_read(fns, marker=None):
+        out = update_many(fns, marker)
+        # the fold committed but has not dropped its pending events yet
+        assert journal.view("u")["stats"]["total"] == 1
+        return out
+
+    store.update_many = commit_then_read
+    journal.compact()
+    assert journal.view("u")["stats"]["total"] == 1
+    journal.close()
+
+
+def test_trim_rolls_old_wrongs_into_the_archive():
+    rec = new_record()
+    for i in range(5):
+        apply_event(rec, wrong_event(i, "bone:Frontal:latin" if i % 2 else "cn:CN X:foramen_to_cn"), wrongs_keep=2)
+    assert [w["q"] for w in rec["wrongs"]] == ["q3", "q4"]
+    archive = rec["wrong_archive"]
+    assert (archive["count"], archive["first_ts"], archive["last_ts"]) == (3, 1000, 1002)
+    assert archive["items"] == {"cn:CN X": 2, "bone:Frontal": 1}
+    assert archive["modes"] == {"foramen_to_cn": 2, "latin": 1}
+    # the miss counters keep every wrong, trimmed or not
+    assert rec["misses"] == {"bone:Frontal:latin": 2, "cn:CN X:foramen_to_cn": 3}
+    assert not trim_wrongs(rec, 2)
+
+
+def test_clear_and_reset_events():
+    rec = new_record()
+    apply_event(rec, wrong_event(0), wrongs_keep=0)
+    apply_event(rec, {"t": "stats", "correct": 1, "total": 2})
+    apply_event(rec, {"t": "clear_wrongs"})
+    assert (rec["wrongs"], rec["misses"], "wrong_archive" in rec) == ([], {}, False)
+    assert rec["stats"] == {"correct": 1, "total": 2}
+    apply_event(rec, {"t": "reset_stats"})
+    assert rec["stats"] == {"correct": 0, "total": 0}
+
+
+def test_review_event_updates_schedule_attempts_and_activity():
+    rec = new_record()
+    for ok in (True, False, True):
+        apply_event(rec, {"t": "review", "item": "bone:Frontal", "qid": "bone:Frontal:latin", "ok": ok,
+                          "ts": 1_700_000_000})
+    assert rec["attempts"] == {"bone:Frontal:latin": [3, 2]}
+    assert rec["srs"]["bone:Frontal"]["reps"] == 1
+    assert rec["activity"]["counts"] == [3]
+
+
+def test_replace_event_copies_and_trims():
+    data = {**new_record(), "wrongs": [{"q": f"q{i}", "user": "u", "correct": "c", "ts": i} for i in range(4)]}
+    rec = new_record()
+    apply_event(rec, {"t": "replace", "data": data}, wrongs_keep=1)
+    assert [w["q"] for w in rec["wrongs"]] == ["q3"]
+    assert len(data["wrongs"]) == 4
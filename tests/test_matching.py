@@ -0,0 +1,31 @@
+import pytest
+
+import config
+from catalog import load_catalog
+from matching import Matcher, normalize
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return Matcher(load_catalog(config.PACKS_DIR))
+
+
+def test_normalize_turkish_and_diacritics():
+    assert normalize("  İNCİ  Işık, Çene! ") == "inci isik cene"
+
+
+def test_branch_nerves_do_not_collide_with_numbers(matcher):
+    assert matcher.resolve("51") == set()
+    assert matcher.resolve("CN 5 1") == {"CN V1"}
+    assert matcher.resolve("cn v1") == {"CN V1"}
+
+
+def test_roman_arabic_and_names(matcher):
+    assert "CN VII" in matcher.resolve("7")
+    assert "CN VII" in matcher.resolve("cn vii")
+    assert matcher.accepts("hypoglossal", ["CN XII"])
+
+
+def test_typos_resolve_to_the_closest_answer(matcher):
+    assert matcher.accepts("Os frontle", ["Os frontale"])
+    assert not matcher.accepts("Os parietale", ["Os frontale"])
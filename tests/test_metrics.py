@@ -0,0 +1,29 @@
+import shutil
+import time
+
+from metrics import Metrics, TextfileExporter
+
+
+def wait_for(cond, timeout=5.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        if cond():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_exporter_survives_a_failed_write(tmp_path):
+    metrics = Metrics()
+    metrics.inc("skull_journal_events_total", 3)
+    out = tmp_path / "prom"
+    exporter = TextfileExporter(metrics, out, interval=0.05)
+    assert wait_for(exporter.path.exists)
+    text = exporter.path.read_text(encoding="utf-8")
+    assert f'skull_journal_events_total{{replica="{exporter.replica}"}} 3' in text
+    assert "instance=" not in text
+
+    shutil.rmtree(out)  # writes fail until the directory is back
+    time.sleep(0.2)
+    out.mkdir()
+    assert wait_for(exporter.path.exists)
@@ -0,0 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import METRICS
+from prefetch import Prefetcher
+
+
+def prefetch_counts():
+    return {c["labels"]["result"]: c["value"] for c in METRICS.snapshot()[1] if c["metric"] == "skull_prefetch_total"}
+
+
+def test_lookahead_loads_each_question_once():
+    loaded = []
+
+    def load(x):
+        loaded.append(x)
+        return x * 10
+
+    before = prefetch_counts()
+    with ThreadPoolExecutor(2) as pool:
+        p = Prefetcher(pool, [1, 2, 3, 4, 5], load, ahead=2)
+        results = []
+        for i in range(5):
+            for fut in list(p._futures.values()):  # the student takes longer than the loads
+                fut.result()
+            results.append(p.get(i))
+        assert results == [10, 20, 30, 40, 50]
+        assert p.get(4) == 50  # a rerun of the same question reuses it
+        p.close()
+    assert sorted(loaded) == [1, 2, 3, 4, 5]
+    after = prefetch_counts()
+    assert sum(after.values()) - sum(before.values()) == 5
+    assert after.get("hit", 0) - before.get("hit", 0) == 5
+
+
+def test_failed_prefetch_is_retried_inline():
+    calls = []
+
+    def load(x):
+        calls.append(x)
+        if len(calls) == 1:
+            raise OSError("image missing")
+        return x
+
+    with ThreadPoolExecutor(1) as pool:
+        p = Prefetcher(pool, ["a"], load, ahead=1)
+        assert p.get(0) == "a"
+    assert calls == ["a", "a"]
@@ -0,0 +1,28 @@
+import pytest
+
+import config
+from catalog import load_catalog
+from questions import backfill_question_ids
+
+FRONTAL = {"q": "**Frontal** kemiğinin Latin adı nedir?", "user": "a", "correct": "Os frontale"}
+JUGULAR = {"q": "**Jugular foramen** içinden geçen sinir hangisi?", "user": "a", "correct": "CN X (Vagus)"}
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return load_catalog(config.PACKS_DIR)
+
+
+def test_backfill_counts_only_newly_tagged_wrongs(catalog):
+    rec = {"wrongs": [dict(JUGULAR), {**FRONTAL, "qid": "bone:Frontal:latin"}],
+           "misses": {"bone:Frontal:latin": 1}}
+    assert backfill_question_ids(catalog, rec)
+    assert rec["misses"] == {"bone:Frontal:latin": 1, "cn:CN X:foramen_to_cn": 1}
+
+
+def test_backfill_builds_missing_counters(catalog):
+    rec = {"wrongs": [dict(FRONTAL), {**FRONTAL, "qid": "bone:Frontal:latin"}]}
+    assert backfill_question_ids(catalog, rec)
+    assert rec["misses"] == {"bone:Frontal:latin": 2}
+    assert not backfill_question_ids(catalog, rec)
+    assert rec["misses"] == {"bone:Frontal:latin": 2}
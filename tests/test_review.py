@@ -0,0 +1,56 @@
+from review import ReviewIndex, signature
+
+
+def wrong(i, qid, user="x", tab="quiz"):
+    return {"q": f"**{qid}** ?", "user": user, "correct": "c", "qid": qid, "ts": 1000 + i, "tab": tab}
+
+
+def wrongs(n):
+    return [wrong(i, f"bone:B{i}:latin" if i % 2 else f"cn:CN {i}:cn_to_foramen", tab="exam" if i % 3 == 0 else "quiz")
+            for i in range(n)]
+
+
+def walk(index, **filters):
+    seen, cursor, pages = [], None, 0
+    while True:
+        rows, cursor, total = index.query(after=cursor, limit=4, **filters)
+        seen += rows
+        pages += 1
+        if cursor is None:
+            return seen, total, pages
+
+
+def test_pages_cover_every_entry_once_newest_first():
+    index = ReviewIndex(wrongs(10))
+    seen, total, pages = walk(index)
+    assert total == 10 and pages == 3
+    assert [e["last_ts"] for e in seen] == list(range(1009, 999, -1))
+
+
+def test_filters_and_cursor_combine():
+    index = ReviewIndex(wrongs(10))
+    seen, total, _ = walk(index, prefix="bone:", tabs=["quiz"])
+    assert total == len(seen) == 3  # odd i, not a multiple of 3: 1, 5, 7
+    assert [e["item"] for e in seen] == ["bone:B7", "bone:B5", "bone:B1"]
+    rows, cursor, total = index.query(modes=["latin"], since=1006)
+    assert [e["last_ts"] for e in rows] == [1009, 1007] and cursor is None and total == 2
+
+
+def test_identical_misses_are_merged_and_searchable():
+    ws = [wrong(0, "bone:Frontal:latin", "Os Frontal"), wrong(5, "bone:Frontal:latin", "os  frontal", tab="exam"),
+          wrong(3, "bone:Frontal:latin", "other")]
+    index = ReviewIndex(ws, describe=lambda item: "Os frontale Neurocranium")
+    assert len(index) == 2
+    merged = next(e for e in index.entries if e["count"] == 2)
+    assert (merged["first_ts"], merged["last_ts"], merged["tab"]) == (1000, 1005, "exam")
+    rows, _, total = index.query("neurocran frontal")
+    assert total == 2
+    assert index.query("missing")[2] == 0
+
+
+def test_signature_changes_when_wrongs_change():
+    ws = wrongs(3)
+    sig = signature(ws)
+    ws.append(wrong(9, "bone:B9:latin"))
+    assert signature(ws) != sig
+    assert signature([]) == (0,)
@@ -0,0 +1,32 @@
+import random
+
+from srs import DAY, MIN_EASE, RELEARN_SECONDS, build_queue, pop_next, push, review
+
+
+def test_intervals_grow_with_consecutive_passes():
+    s = review(None, True, 0)
+    assert (s["reps"], s["ivl"], s["due"]) == (1, DAY, DAY)
+    s = review(s, True, 10)
+    assert (s["ivl"], s["due"]) == (6 * DAY, 10 + 6 * DAY)
+    s = review(s, True, 20)
+    assert s["ivl"] == int(6 * DAY * 2.7) and s["ease"] == 2.8
+
+
+def test_miss_resets_and_lowers_ease_to_a_floor():
+    state = review(review(None, True, 0), True, 0)
+    s = review(state, False, 100)
+    assert (s["reps"], s["ivl"], s["due"]) == (0, RELEARN_SECONDS, 100 + RELEARN_SECONDS)
+    assert state["reps"] == 2  # input left alone
+    for _ in range(20):
+        s = review(s, False, 100)
+    assert s["ease"] == MIN_EASE
+
+
+def test_queue_orders_unseen_and_due_items_first():
+    rng = random.Random(1)
+    states = {"a": {"due": 500}, "b": {"due": 100}}
+    heap = build_queue(["a", "b", "c"], states, rng=rng)
+    assert [pop_next(heap) for _ in range(3)] == ["c", "b", "a"]
+    push(heap, "b", 50, rng)
+    push(heap, "a", 10, rng)
+    assert pop_next(heap) == "a"
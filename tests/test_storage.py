@@ -0,0 +1,140 @@
+import threading
+
+import pytest
+
+import bench
+from storage import CachedUserStore, SqliteUserStore, VersionConflict
+
+
+def in_thread(fn):
+    out = []
+    t = threading.Thread(target=lambda: out.append(fn()))
+    t.start()
+    t.join()
+    return out[0]
+
+
+def test_sqlite_reuses_connections_across_threads(tmp_path):
+    store = SqliteUserStore(tmp_path / "users.db")
+    # every Streamlit rerun is a new thread; they must not each open a connection
+    for i in range(3):
+        in_thread(lambda: store.put("u", {"n": i}))
+        assert in_thread(lambda: store.get("u")) == {"n": i}
+    assert len(store._idle) == 1
+
+
+def test_sqlite_update_and_changed_since(tmp_path):
+    store = SqliteUserStore(tmp_path / "users.db")
+    seq0 = store.last_seq()
+    rec = store.update("u", lambda r: r["stats"].update(total=3))
+    assert rec["stats"]["total"] == 3
+    assert [uid for uid, _ in store.changed_since(seq0)] == ["u"]
+
+
+def test_change_feed_is_shared_by_threads(tmp_path):
+    store = SqliteUserStore(tmp_path / "users.db")
+    other = SqliteUserStore(tmp_path / "users.db")  # another replica on the same file
+    store.may_have_changed()
+    # fresh threads with no writes in between: nothing to sync
+    assert [in_thread(store.may_have_changed) for _ in range(3)] == [False, False, False]
+    other.put("u", {"n": 1})
+    assert in_thread(store.may_have_changed) is True
+    assert in_thread(store.may_have_changed) is False
+
+
+def test_cache_sync_drops_records_changed_elsewhere(tmp_path):
+    cache = CachedUserStore(SqliteUserStore(tmp_path / "users.db"))
+    other = SqliteUserStore(tmp_path / "users.db")
+    cache.put("u", {"n": 1})
+    cache.sync()
+    other.put("u", {"n": 2})
+    assert cache.get("u") == {"n": 1}
+    in_thread(cache.sync)
+    assert cache.get("u") == {"n": 2}
+
+
+def test_cache_miss_racing_sync_is_not_cached_stale(tmp_path):
+    inner = SqliteUserStore(tmp_path / "users.db")
+    cache = CachedUserStore(inner)
+    other = SqliteUserStore(tmp_path / "users.db")
+    other.put("u", {"n": 1})
+    cache.sync()
+
+    read = inner.get_versioned
+
+    def slow_read(uid):
+        hit = read(uid)  # old version read ...
+        other.put("u", {"n": 2})  # ... then another replica writes and a rerun syncs
+        cache.sync()
+        return hit
+
+    inner.get_versioned = slow_read
+    assert cache.get("u") == {"n": 1}
+    inner.get_versioned = read
+    assert cache.get("u") == {"n": 2}
+
+
+def test_compare_and_put_rejects_stale_versions(tmp_path):
+    store = SqliteUserStore(tmp_path / "users.db")
+    seq = store.compare_and_put("u", {"n": 1}, 0)
+    assert seq is not None
+    assert store.compare_and_put("u", {"n": 2}, 0) is None  # exists already
+    assert store.compare_and_put("u", {"n": 2}, seq) > seq
+    assert store.compare_and_put("u", {"n": 3}, seq) is None  # someone wrote after seq
+    assert store.get("u") == {"n": 2}
+
+
+def test_update_optimistic_reruns_on_the_newer_version(tmp_path):
+    store = CachedUserStore(SqliteUserStore(tmp_path / "users.db"), max_bytes=1 << 20)
+    store.put("u", {"n": 0})
+    calls = []
+
+    def bump(rec):
+        calls.append(rec["n"])
+        if len(calls) == 1:  # another process commits between the read and the write
+            store.inner.put("u", {"n": 10})
+        rec["n"] += 1
+
+    rec, _ = store.update_optimistic("u", bump)
+    assert calls == [0, 10]
+    assert rec == store.get("u") == {"n": 11}
+
+
+def test_update_optimistic_gives_up_with_version_conflict(tmp_path):
+    store = SqliteUserStore(tmp_path / "users.db")
+    store.put("u", {"n": 0})
+
+    def always_loses(rec):
+        store.put("u", {"n": 0})
+
+    with pytest.raises(VersionConflict):
+        store.update_optimistic("u", always_loses, retries=3)
+
+
+def test_replicas_lose_no_answers_or_increments(tmp_path):
+    # separate processes with their own journal and cache over one data dir
+    res = bench.bench_replicas(tmp_path, procs=3, ops=150, users=5, cas_every=2)
+    assert (res["answers"], res["counter"]) == (res["answers_expected"], res["counter_expected"])
+    assert not res["lost"]
+
+
+
+def test_concurrent_first_open_sets_up_the_schema_once(tmp_path):
+    errors = []
+    for n in range(10):
+        db = tmp_path / f"users{n}.db"
+        barrier = threading.Barrier(6)
+
+        def open_store():
+            barrier.wait()
+            try:
+                SqliteUserStore(db).put("u", {"n": 1})
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=open_store) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    assert errors == []
@@ -0,0 +1,37 @@
+import logging
+import threading
+from collections import deque
+
+from metrics import observe
+
+log = logging.getLogger("skull_trainer")
+
+
+class RunTimes:
+    """
+    Script run durations of this process. The first run is the cold start (imports,
+    packs, storage, journal recovery, image variants); later runs are warm reruns.
+    """
+
+    def __init__(self, keep: int = 500):
+        self.cold_ms: float | None = None
+        self.warm_ms: deque[float] = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        ms = seconds * 1000
+        with self._lock:
+            cold = self.cold_ms is None
+            if cold:
+                self.cold_ms = ms
+                log.info("cold start: %.0f ms", ms)
+            else:
+                self.warm_ms.append(ms)
+        observe("skull_script_run_seconds", seconds, run="cold" if cold else "warm")
+
+    def summary(self) -> dict:
+        with self._lock:
+            warm = sorted(self.warm_ms)
+        pick = lambda p: round(warm[min(len(warm) - 1, int(p * len(warm)))], 1) if warm else None
+        return {"cold_ms": round(self.cold_ms, 1) if self.cold_ms is not None else None,
+                "warm_runs": len(warm), "warm_p50_ms": pick(0.5), "warm_p95_ms": pick(0.95)}
@@ -0,0 +1,99 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from journal import AnswerJournal
+
+log = logging.getLogger("skull_trainer")
+
+
+class UnitOfWork:
+    """The events of one quiz round, buffered in the session until the round is committed."""
+
+    def __init__(self, writer: "BackgroundWriter", uid: str):
+        self.writer = writer
+        self.uid = uid
+        self.events: list[dict] = []
+        self.touched = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, ev: dict) -> None:
+        with self._lock:
+            self.events.append(ev)
+            self.touched = time.time()
+        self.writer._register(self)
+
+    def take(self) -> list[dict]:
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+    def commit(self) -> None:
+        self.writer.commit(self)
+
+
+class BackgroundWriter:
+    """
+    Commits units of work to the journal from a writer thread, so the request path only
+    enqueues. The queue is bounded; when it is full the caller writes inline instead of
+    dropping answers.
+
+    Rounds whose session went quiet for `idle_flush` seconds (closed tab, session timeout)
+    are committed by a reaper thread, and everything still open is committed at exit.
+    """
+
+    def __init__(self, journal: AnswerJournal, maxsize: int = 1024, idle_flush: float = 10 * 60):
+        self.journal = journal
+        self.idle_flush = idle_flush
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self._open: dict[int, UnitOfWork] = {}
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+        threading.Thread(target=self._write_loop, daemon=True).start()
+        threading.Thread(target=self._reap_loop, daemon=True).start()
+
+    def open(self, uid: str) -> UnitOfWork:
+        return UnitOfWork(self, uid)
+
+    def _register(self, uow: UnitOfWork) -> None:
+        with self._lock:
+            self._open[id(uow)] = uow
+
+    def commit(self, uow: UnitOfWork) -> None:
+        with self._lock:
+            self._open.pop(id(uow), None)
+        events = uow.take()
+        if not events:
+            return
+        try:
+            self._queue.put_nowait((uow.uid, events))
+        except queue.Full:
+            self.journal.append_many(uow.uid, events)
+
+    def _write_loop(self) -> None:
+        while True:
+            uid, events = self._queue.get()
+            try:
+                self.journal.append_many(uid, events)
+            except Exception:  # keep the thread alive; close() waits on the queue
+                log.exception("could not write %d events of %s", len(events), uid)
+            finally:
+                self._queue.task_done()
+
+    def _reap_loop(self) -> None:
+        while True:
+            time.sleep(min(60, self.idle_flush))
+            cutoff = time.time() - self.idle_flush
+            with self._lock:
+                idle = [u for u in self._open.values() if u.touched < cutoff]
+            for uow in idle:
+                self.commit(uow)
+
+    def close(self) -> None:
+        with self._lock:
+            still_open = list(self._open.values())
+        for uow in still_open:
+            self.commit(uow)
+        self._queue.join()  # the writer thread is still alive during atexit